@@ -1,13 +1,24 @@
 import os
+import re
 import json
+import hashlib
+import asyncio
+import queue
+import threading
+from contextvars import ContextVar
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
 import google.generativeai as genai
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.messages import AIMessage, HumanMessage
-from langchain.tools import tool
+from langchain_core.agents import AgentAction, AgentStep
+from langchain.tools import StructuredTool
 from langchain.agents import create_openai_tools_agent
 from langchain.agents import AgentExecutor
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Iterator, AsyncIterator, Callable, Sequence, Tuple, Union
+import numpy as np
 import pandas as pd # Import pandas
 
 import utils
@@ -27,8 +38,147 @@ except Exception as e:
     print(f"Initial product load failed: {e}")
     products_df = pd.DataFrame() # Create empty df if load fails
 
+# Worker threads for the pandas-backed tools when the agent runs them asynchronously
+_POOL = ThreadPoolExecutor(max_workers=os.cpu_count())
+
+def _pooled_tool(func: Callable[..., str]) -> StructuredTool:
+    """
+    Build a tool like @tool does, with async invocations running the function on _POOL
+    so pandas work never blocks the event loop.
+    
+    Args:
+        func: Synchronous tool function; its signature and docstring define the tool
+    
+    Returns:
+        StructuredTool usable through both invoke and ainvoke
+    """
+    async def run_in_pool(*args: Any, **kwargs: Any) -> str:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_POOL, partial(func, *args, **kwargs))
+    
+    return StructuredTool.from_function(func=func, coroutine=run_in_pool)
+
+def _catalog_version() -> int:
+    """
+    Current catalog version for the tool cache keys, reloading the CSV first if it changed
+    
+    Returns:
+        utils.PRODUCTS_VERSION after the check (a single os.stat when nothing changed)
+    """
+    utils.load_products_data()
+    return utils.PRODUCTS_VERSION
+
+def _round_price(value: Optional[float]) -> Optional[float]:
+    """Round a price argument to cents so near-identical calls share a cache entry"""
+    return round(float(value), 2) if value is not None else None
+
+# Formatters for the optional fields appended to product summary lines
+_LINE_FIELD_FORMATS = {
+    'category': lambda value: f", Category: {value}",
+    'brand': lambda value: f", Brand: {value}",
+    'rating': lambda value: f", Rating: {value:.1f}/5",
+    'in_stock': lambda value: f", Status: {'In Stock' if value else 'Out of Stock'}",
+}
+
+def _format_product_lines(products: pd.DataFrame, fields: List[str]) -> List[str]:
+    """
+    Format one summary line per product, reading whole columns instead of iterating rows
+    
+    Args:
+        products: DataFrame of products to format
+        fields: Optional fields to append after ID, name and price (keys of _LINE_FIELD_FORMATS)
+    
+    Returns:
+        List of formatted product lines
+    """
+    parts = [[
+        f"ID: {product_id}, Name: {name}, Price: ${price:.2f}"
+        for product_id, name, price in zip(
+            products['id'].to_numpy(), products['name'].to_numpy(), products['price'].to_numpy()
+        )
+    ]]
+    for field in fields:
+        # Column presence and missing values are resolved once per column, not per row
+        if field not in products.columns:
+            continue
+        formatter = _LINE_FIELD_FORMATS[field]
+        present = products[field].notna().to_numpy()
+        parts.append([
+            formatter(value) if is_present else ""
+            for value, is_present in zip(products[field].to_numpy(), present)
+        ])
+    return ["".join(line_parts) for line_parts in zip(*parts)]
+
+# Decimal places kept for numeric fields in JSON tool results
+_JSON_ROUNDING = {'price': 2, 'rating': 1}
+
+def _products_json(products: pd.DataFrame, fields: List[str], **summary: Any) -> str:
+    """
+    Serialize products as compact JSON for the model, leaving out missing fields
+    
+    Args:
+        products: DataFrame of products to serialize
+        fields: Columns to include for each product
+        summary: Extra top-level keys (e.g. count)
+    
+    Returns:
+        JSON string of the form {...summary, "items": [{field: value}, ...]}
+    """
+    columns = {}
+    for field in fields:
+        if field not in products.columns:
+            continue
+        column = products[field]
+        if field in _JSON_ROUNDING:
+            column = column.round(_JSON_ROUNDING[field])
+        # tolist() yields plain Python values that json can serialize
+        columns[field] = (column.tolist(), column.notna().tolist())
+    
+    items = [
+        {field: values[row] for field, (values, present) in columns.items() if present[row]}
+        for row in range(len(products))
+    ]
+    return json.dumps({**summary, "items": items}, separators=(',', ':'), ensure_ascii=False)
+
 # Define tools for the agent to use
-@tool
+# Tool bodies. Each tool normalizes its arguments into a hashable key and
+# delegates to an lru_cache-backed wrapper, so repeated calls against the
+# same catalog version return the already formatted string.
+def _search_products_impl(
+    query: str,
+    min_price: Optional[float],
+    max_price: Optional[float],
+    category: Optional[str],
+    brand: Optional[str],
+    rating_min: Optional[float],
+    in_stock_only: bool,
+    sort_by: str
+) -> str:
+    # Filter products using the updated utils function
+    filtered_products = utils.search_products(
+        query,
+        min_price, 
+        max_price, 
+        category,
+        brand,
+        rating_min,
+        in_stock_only,
+        sort_by
+    )
+    
+    # Stock status is only informative when out-of-stock items are included
+    fields = ['id', 'name', 'price', 'category', 'brand', 'rating']
+    if not in_stock_only:
+        fields.append('in_stock')
+    
+    return _products_json(filtered_products, fields, count=len(filtered_products))
+
+@lru_cache(maxsize=512)
+def _search_products_cached(key: tuple) -> str:
+    # The last key element is the catalog version; it only partitions the cache
+    return _search_products_impl(*key[:-1])
+
+@_pooled_tool
 def search_products(
     query: Optional[str] = "", # Make query optional with default empty string
     min_price: Optional[float] = None, 
@@ -54,71 +204,56 @@ def search_products(
         sort_by: Sort order (options: "price_low", "price_high", "rating", "newest"; default: "price_low")
     
     Returns:
-        String containing search results formatted for display
+        Compact JSON with the number of matches ("count") and the matching products ("items")
     """
     try:
-        # Filter products using the updated utils function
-        filtered_products = utils.search_products(
-            query if query else "", # Pass empty string if query is None or empty
-            min_price, 
-            max_price, 
+        key = (
+            (query or "").strip().lower(), # Pass empty string if query is None or empty
+            _round_price(min_price),
+            _round_price(max_price),
             category,
             brand,
             rating_min,
             in_stock_only,
-            sort_by
+            sort_by,
+            _catalog_version()
         )
-        
-        if filtered_products.empty:
-            return "No products found matching your criteria."
-        
-        # Format results
-        results = []
-        for _, product in filtered_products.iterrows():
-            # Construct product info string
-            product_info = f"ID: {product['id']}, Name: {product['name']}, Price: ${product['price']:.2f}, Category: {product['category']}"
-            if 'brand' in product and pd.notna(product['brand']):
-                product_info += f", Brand: {product['brand']}"
-            if 'rating' in product and pd.notna(product['rating']):
-                product_info += f", Rating: {product['rating']:.1f}/5"
-            if 'in_stock' in product and pd.notna(product['in_stock']):
-                 stock_status = "In Stock" if product['in_stock'] == True or str(product['in_stock']).lower() == 'true' else "Out of Stock"
-                 product_info += f", Status: {stock_status}"
-            results.append(product_info)
-        
-        result_text = "\n".join(results)
-        
-        # Add summary of results
-        summary = f"Found {len(results)} products"
-        if category:
-            summary += f" in the {category} category"
-        if brand:
-             summary += f" from the {brand} brand"
-        if min_price is not None and max_price is not None:
-            summary += f" priced between ${min_price:.2f} and ${max_price:.2f}"
-        elif min_price is not None:
-            summary += f" priced above ${min_price:.2f}"
-        elif max_price is not None:
-            summary += f" priced below ${max_price:.2f}"
-        if rating_min is not None:
-            summary += f" with minimum rating {rating_min:.1f}"
-        if in_stock_only:
-            summary += " (in stock)"
-            
-        sort_descriptions = {
-            "price_low": "sorted by price: low to high",
-            "price_high": "sorted by price: high to low",
-            "rating": "sorted by rating",
-            "newest": "sorted by newest"
-        }
-        summary += f", {sort_descriptions.get(sort_by, '')}"
-            
-        return f"{summary}:\n\n{result_text}"
+        return _search_products_cached(key)
     
     except Exception as e:
         return f"Error searching products: {str(e)}"
 
-@tool
+def _product_detail_lines(product: Dict[str, Any]) -> List[str]:
+    # Format all product details nicely, one field per line
+    details = []
+    for column, value in product.items():
+        # Format price specifically
+        if column == 'price':
+            details.append(f"{column.title()}: ${value:.2f}")
+        elif column == 'rating':
+            details.append(f"{column.title()}: {value:.1f}/5")
+        elif column == 'in_stock':
+             stock_status = "Yes" if value else "No"
+             details.append(f"In Stock: {stock_status}")
+        elif column != 'id': # Don't repeat ID
+            details.append(f"{column.title()}: {value}")
+    
+    return details
+
+def _get_product_details_impl(product_id: int) -> str:
+    # Look up product by ID, with missing values already left out
+    product = utils.get_product_by_id(product_id, drop_missing=True)
+    
+    if product is None:
+        return f"No product found with ID {product_id}."
+    
+    return "\n".join(_product_detail_lines(product))
+
+@lru_cache(maxsize=512)
+def _get_product_details_cached(product_id: int, version: int) -> str:
+    return _get_product_details_impl(product_id)
+
+@_pooled_tool
 def get_product_details(product_id: int) -> str:
     """
     Get detailed information about a specific product by its ID.
@@ -130,33 +265,32 @@ def get_product_details(product_id: int) -> str:
         String containing detailed product information
     """
     try:
-        # Look up product by ID
-        product = utils.get_product_by_id(product_id)
-        
-        if product is None:
-            return f"No product found with ID {product_id}."
-        
-        # Format all product details nicely
-        details = []
-        for column, value in product.items():
-            if pd.notna(value):  # Only include non-NaN values
-                # Format price specifically
-                if column == 'price':
-                    details.append(f"{column.title()}: ${value:.2f}")
-                elif column == 'rating':
-                    details.append(f"{column.title()}: {value:.1f}/5")
-                elif column == 'in_stock':
-                     stock_status = "Yes" if value == True or str(value).lower() == 'true' else "No"
-                     details.append(f"In Stock: {stock_status}")
-                elif column != 'id': # Don't repeat ID
-                    details.append(f"{column.title()}: {value}")
-        
-        return "\n".join(details)
+        return _get_product_details_cached(int(product_id), _catalog_version())
     
     except Exception as e:
         return f"Error retrieving product details: {str(e)}"
 
-@tool
+def _check_stock_impl(product_id: int) -> str:
+    # Look up product by ID
+    product = utils.get_product_by_id(product_id)
+    
+    if product is None:
+        return f"No product found with ID {product_id}."
+    
+    # Check stock status (in_stock is a bool column whenever it is present)
+    if 'in_stock' not in product:
+        return f"Stock information not available for product {product_id} ({product['name']})."
+    
+    if product['in_stock']:
+        return f"Product {product_id} ({product['name']}) is in stock. 👍"
+    else:
+        return f"Product {product_id} ({product['name']}) is currently out of stock. 😞"
+
+@lru_cache(maxsize=512)
+def _check_stock_cached(product_id: int, version: int) -> str:
+    return _check_stock_impl(product_id)
+
+@_pooled_tool
 def check_stock(product_id: int) -> str:
     """
     Check if a product is in stock.
@@ -168,27 +302,34 @@ def check_stock(product_id: int) -> str:
         String indicating whether the product is in stock
     """
     try:
-        # Look up product by ID
-        product = utils.get_product_by_id(product_id)
-        
-        if product is None:
-            return f"No product found with ID {product_id}."
-        
-        # Check stock status
-        if 'in_stock' not in product or pd.isna(product['in_stock']):
-            return f"Stock information not available for product {product_id} ({product['name']})."
-        
-        is_in_stock = product['in_stock'] == True or str(product['in_stock']).lower() == 'true'
-        
-        if is_in_stock:
-            return f"Product {product_id} ({product['name']}) is in stock. 👍"
-        else:
-            return f"Product {product_id} ({product['name']}) is currently out of stock. 😞"
+        return _check_stock_cached(int(product_id), _catalog_version())
     
     except Exception as e:
         return f"Error checking stock: {str(e)}"
 
-@tool
+def _list_product_categories_impl() -> str:
+    if products_df.empty:
+        return "Product data not loaded yet. Please try again shortly."
+    
+    # Counts are precomputed and already sorted by category name
+    categories = utils.get_category_count()
+    
+    if not categories:
+        return "No product categories found."
+    
+    # Format results as Markdown, since the router shows this listing to the user as is
+    return f"We have {len(categories)} product categories:\n\n" + utils.markdown_list(
+        [f"{category}: {count} products" for category, count in categories.items()]
+    )
+
+@lru_cache(maxsize=512)
+def _list_product_categories_cached(version: int) -> str:
+    return _list_product_categories_impl()
+
+# Build the category listing at import; it is served from cache until the catalog changes
+_list_product_categories_cached(utils.PRODUCTS_VERSION)
+
+@_pooled_tool
 def list_product_categories() -> str:
     """
     Get a list of all product categories available in the store.
@@ -197,25 +338,57 @@ def list_product_categories() -> str:
         String containing a list of all product categories with counts
     """
     try:
-        if products_df.empty:
-            return "Product data not loaded yet. Please try again shortly."
-        
-        categories = products_df['category'].value_counts().to_dict()
-        
-        if not categories:
-            return "No product categories found."
-        
-        # Format results
-        result_lines = [f"We have {len(categories)} product categories:"]
-        for category, count in sorted(categories.items()):
-            result_lines.append(f"- {category}: {count} products")
-        
-        return "\n".join(result_lines)
+        return _list_product_categories_cached(_catalog_version())
     
     except Exception as e:
         return f"Error listing categories: {str(e)}"
 
-@tool
+def _category_products(category: str) -> pd.DataFrame:
+    # Use the search_products function for consistency; one extra row tells us whether there are more
+    return utils.search_products(query="", category=category, in_stock_only=False, top_k=21)
+
+def _get_category_products_impl(category: str) -> str:
+    if products_df.empty:
+        return "Product data not loaded yet. Please try again shortly."
+    
+    category_products = _category_products(category)
+    return _products_json(
+        category_products.head(20),
+        ['id', 'name', 'price', 'rating'],
+        count=min(len(category_products), 20),
+        more=len(category_products) > 20
+    )
+
+@lru_cache(maxsize=512)
+def _get_category_products_cached(category: str, version: int) -> str:
+    return _get_category_products_impl(category)
+
+@lru_cache(maxsize=512)
+def _category_products_text_cached(category: str, version: int) -> str:
+    # Markdown listing for answers that skip the LLM (see _ROUTER)
+    category_products = _category_products(category)
+    
+    if category_products.empty:
+         return f"No products found in the '{category}' category. Perhaps try searching all categories or use the filters?"
+    else:
+        result = f"Products in the '{category}' category:\n\n"
+    
+    # Format only the rows that will be shown, one bullet per product
+    product_list = _format_product_lines(category_products.head(20), ['rating'])
+    
+    return result + utils.markdown_list(product_list) + ("\n\n... (showing top 20 results)" if len(category_products) > 20 else "")
+
+@lru_cache(maxsize=512)
+def _product_details_text_cached(product_id: int, version: int) -> str:
+    # Markdown details for answers that skip the LLM (see _ROUTER)
+    product = utils.get_product_by_id(product_id, drop_missing=True)
+    
+    if product is None:
+        return f"No product found with ID {product_id}."
+    
+    return f"Details for product {product_id}:\n\n" + utils.markdown_list(_product_detail_lines(product))
+
+@_pooled_tool
 def get_category_products(category: str) -> str:
     """
     Get all products in a specific category.
@@ -224,34 +397,29 @@ def get_category_products(category: str) -> str:
         category: The category to get products for
     
     Returns:
-        String containing a list of products in the category
+        Compact JSON with up to 20 products ("items"), their number ("count") and whether more exist ("more")
     """
     try:
-        if products_df.empty:
-            return "Product data not loaded yet. Please try again shortly."
-            
-        # Use the search_products function for consistency
-        category_products = utils.search_products(query="", category=category, in_stock_only=False)
-        
-        if category_products.empty:
-             return f"No products found in the '{category}' category. Perhaps try searching all categories or use the filters?"
-        else:
-            result = f"Products in the '{category}' category:\n\n"
-        
-        # Format results
-        product_list = []
-        for _, product in category_products.iterrows():
-            product_info = f"ID: {product['id']}, Name: {product['name']}, Price: ${product['price']:.2f}"
-            if 'rating' in product and pd.notna(product['rating']):
-                 product_info += f", Rating: {product['rating']:.1f}/5"
-            product_list.append(product_info)
-        
-        return result + "\n".join(product_list[:20]) + ("\n... (showing top 20 results)" if len(product_list) > 20 else "")
+        return _get_category_products_cached(category.strip(), _catalog_version())
     
     except Exception as e:
         return f"Error getting category products: {str(e)}"
 
-@tool
+def _recommend_products_impl(query: str, budget: Optional[float]) -> str:
+    # Search for the top 5 products based on the query, prioritizing highly rated ones
+    top_recommendations = utils.search_products(query, max_price=budget, sort_by="rating", top_k=5)
+    
+    return _products_json(
+        top_recommendations,
+        ['id', 'name', 'price', 'category', 'rating'],
+        count=len(top_recommendations)
+    )
+
+@lru_cache(maxsize=512)
+def _recommend_products_cached(query: str, budget: Optional[float], version: int) -> str:
+    return _recommend_products_impl(query, budget)
+
+@_pooled_tool
 def recommend_products(query: str, budget: Optional[float] = None) -> str:
     """
     Recommend products based on user preferences or needs.
@@ -261,33 +429,10 @@ def recommend_products(query: str, budget: Optional[float] = None) -> str:
         budget: Optional maximum budget
     
     Returns:
-        String containing recommended products
+        Compact JSON with up to 5 recommended products ("items") and their number ("count")
     """
     try:
-        # Search for products based on the query, prioritizing highly rated ones
-        filtered_products = utils.search_products(query, max_price=budget, sort_by="rating")
-        
-        if filtered_products.empty:
-            return "I couldn't find specific recommendations based on that. Maybe try broadening your search?"
-        
-        # Take top 5 recommendations
-        top_recommendations = filtered_products.head(5)
-        
-        # Format results
-        results = []
-        for _, product in top_recommendations.iterrows():
-            product_info = f"ID: {product['id']}, Name: {product['name']}, Price: ${product['price']:.2f}, Category: {product['category']}"
-            
-            # Add rating if available
-            if 'rating' in product and pd.notna(product['rating']):
-                product_info += f", Rating: {product['rating']:.1f}/5"
-            
-            results.append(product_info)
-        
-        result_text = "\n".join(results)
-        
-        budget_text = f" within your ${budget:.2f} budget" if budget is not None else ""
-        return f"Here are my top recommendations{budget_text} based on '{query}':\n\n{result_text}"
+        return _recommend_products_cached(query.strip().lower(), _round_price(budget), _catalog_version())
     
     except Exception as e:
         return f"Error recommending products: {str(e)}"
@@ -302,9 +447,9 @@ all_tools = {
     "recommend_products": recommend_products
 }
 
-# Define custom prompt for the agent
-custom_prompt = ChatPromptTemplate.from_messages([
-    ("system", """You are ShopSight, a friendly AI shopping assistant for an e-commerce store.
+# Static system instructions, built once at import and sent unchanged on every
+# turn; dynamic content (history, input, scratchpad) goes after it in the prompt.
+SYSTEM_PROMPT = """You are ShopSight, a friendly AI shopping assistant for an e-commerce store.
 
 Your goal is to help customers find products, learn about product details, check availability, and get recommendations.
 
@@ -312,6 +457,8 @@ Be polite, helpful, and concise in your responses. Focus on answering the custom
 
 When searching for products, clearly state the criteria used based on the user's request and the filter parameters provided.
 
+The product list tools (search_products, get_category_products, recommend_products) return compact JSON: "count" is the number of matching products and "items" lists them with fields such as id, name, price, category, brand, rating (out of 5) and in_stock. Present these as a readable list for the customer, with prices in dollars, and summarize the criteria you searched with (category, brand, price range, minimum rating, in-stock only, sort order). A count of 0 means nothing matched; suggest broadening the search.
+
 If a customer asks about a product or category you don't have information about, apologize and suggest alternatives.
 
 Always sound friendly and enthusiastic. Use emojis occasionally to appear more engaging. 😊
@@ -328,62 +475,449 @@ Available tools:
 - get_category_products: Get all products in a specific category. Prefer search_products if other filters are involved.
 - recommend_products: Recommend products based on user needs or preferences. Uses the search tool internally but formats as recommendations.
 
-Use these tools effectively to provide the best shopping experience."""),
+Use these tools effectively to provide the best shopping experience."""
+
+# Define custom prompt for the agent
+custom_prompt = ChatPromptTemplate.from_messages([
+    ("system", SYSTEM_PROMPT),
     MessagesPlaceholder(variable_name="chat_history"),
     ("human", "{input}"),
     MessagesPlaceholder(variable_name="agent_scratchpad"),
 ])
 
-def run_agent_interaction(query: str, chat_history: List, active_tools: List[str]) -> str:
+MODEL_NAME = "gemini-1.5-pro-latest"
+
+# Shared chat model, reused across turns so its client and connection pool persist
+_LLM = ChatGoogleGenerativeAI(
+    model=MODEL_NAME,
+    temperature=0.3,
+    google_api_key=api_keys["GOOGLE_API_KEY"]
+)
+
+# Tools that are always offered to the agent, regardless of the user's toggles
+REQUIRED_TOOL_NAMES = ("search_products", "get_product_details", "list_product_categories")
+
+# Agent round trips allowed per turn; turns that call recommend_products get a little more room
+MAX_ITERATIONS = 3
+RECOMMENDATION_MAX_ITERATIONS = 5
+
+# Observations of the tool calls already made in the current turn, keyed by _tool_call_key
+_SEEN_CALLS: ContextVar[Dict[tuple, Any]] = ContextVar("seen_tool_calls", default={})
+
+# Tool calls the model requests in one step run concurrently, at most this many at once
+MAX_PARALLEL_TOOL_CALLS = 4
+_TOOL_SLOTS: ContextVar[Optional[asyncio.Semaphore]] = ContextVar("tool_slots", default=None)
+
+# How the current turn's agent run went: DedupAgentExecutor sets "recommending" once the
+# agent calls recommend_products, "stopped" when the iteration limit cut the run short
+# and "parse_error" when model output failed to parse
+_RUN_STATUS: ContextVar[Optional[Dict[str, bool]]] = ContextVar("agent_run_status", default=None)
+
+def _mark_run(flag: str) -> None:
+    status = _RUN_STATUS.get()
+    if status is not None:
+        status[flag] = True
+
+def _note_step(step: Union[AgentAction, AgentStep]) -> None:
+    """Record in _RUN_STATUS what an agent step tells about the current run"""
+    action = step.action if isinstance(step, AgentStep) else step
+    if action.tool == "_Exception":
+        _mark_run("parse_error")
+    elif action.tool == "recommend_products":
+        _mark_run("recommending")
+
+def _tool_call_key(action: AgentAction) -> tuple:
+    """Identify a tool call by its tool name and arguments"""
+    return (action.tool, json.dumps(action.tool_input, sort_keys=True, default=str))
+
+class DedupAgentExecutor(AgentExecutor):
+    """
+    AgentExecutor that does not run the same tool call twice in one turn.
+    
+    When the model repeats a call it already made, the earlier observation is
+    handed back instead of invoking the tool again. On the async path, the tool
+    calls of one step are gathered concurrently, bounded by MAX_PARALLEL_TOOL_CALLS.
+    Runs that are stopped early or hit unparsable output are noted in _RUN_STATUS.
+    
+    max_iterations is the ceiling for turns that call recommend_products; every
+    other turn stops after MAX_ITERATIONS.
     """
-    Run the agent with the given query, chat history, and active tools.
+    
+    def _should_continue(self, iterations, time_elapsed):
+        status = _RUN_STATUS.get()
+        if status is not None and not status.get("recommending") and iterations >= MAX_ITERATIONS:
+            should_continue = False
+        else:
+            should_continue = super()._should_continue(iterations, time_elapsed)
+        if not should_continue:
+            # The executor now answers with its canned "Agent stopped ..." text
+            _mark_run("stopped")
+        return should_continue
+    
+    def _iter_next_step(self, name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager=None):
+        token = _SEEN_CALLS.set({_tool_call_key(action): observation for action, observation in intermediate_steps})
+        try:
+            for step in super()._iter_next_step(name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager):
+                _note_step(step)
+                yield step
+        finally:
+            _SEEN_CALLS.reset(token)
+    
+    async def _aiter_next_step(self, name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager=None):
+        token = _SEEN_CALLS.set({_tool_call_key(action): observation for action, observation in intermediate_steps})
+        # Created here so the semaphore belongs to the running event loop
+        slots_token = _TOOL_SLOTS.set(asyncio.Semaphore(MAX_PARALLEL_TOOL_CALLS))
+        try:
+            async for step in super()._aiter_next_step(name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager):
+                _note_step(step)
+                yield step
+        finally:
+            _TOOL_SLOTS.reset(slots_token)
+            _SEEN_CALLS.reset(token)
+    
+    def _perform_agent_action(self, name_to_tool_map, color_mapping, agent_action, run_manager=None):
+        seen_calls = _SEEN_CALLS.get()
+        key = _tool_call_key(agent_action)
+        if key in seen_calls:
+            return AgentStep(action=agent_action, observation=seen_calls[key])
+        return super()._perform_agent_action(name_to_tool_map, color_mapping, agent_action, run_manager)
+    
+    async def _aperform_agent_action(self, name_to_tool_map, color_mapping, agent_action, run_manager=None):
+        seen_calls = _SEEN_CALLS.get()
+        key = _tool_call_key(agent_action)
+        if key in seen_calls:
+            return AgentStep(action=agent_action, observation=seen_calls[key])
+        slots = _TOOL_SLOTS.get()
+        if slots is None:
+            return await super()._aperform_agent_action(name_to_tool_map, color_mapping, agent_action, run_manager)
+        async with slots:
+            return await super()._aperform_agent_action(name_to_tool_map, color_mapping, agent_action, run_manager)
+
+# One agent executor per distinct set of enabled tools
+_EXECUTORS: Dict[frozenset, AgentExecutor] = {}
+
+def _enabled_tool_names(active_tools: Sequence[str]) -> frozenset:
+    """Names of the tools available for a turn: the active ones plus the required ones"""
+    return frozenset(name for name in (*active_tools, *REQUIRED_TOOL_NAMES) if name in all_tools)
+
+def _get_agent_executor(active_tools: Sequence[str]) -> AgentExecutor:
+    """
+    Return the agent executor for the given tools, building it on first use.
     
     Args:
-        query: The user's query
-        chat_history: The chat history as a list of messages
-        active_tools: List of tool names that are currently enabled
+        active_tools: Names of the tools that are currently enabled
     
     Returns:
-        The agent's response as a string
+        AgentExecutor bound to the enabled tools plus the required ones
     """
-    try:
-        # Create LLM - Use a current and valid model name
-        llm = ChatGoogleGenerativeAI(model="gemini-1.5-pro-latest", temperature=0.3)
-        
-        # Filter tools based on active tools
-        filtered_tools = [all_tools[tool_name] for tool_name in active_tools if tool_name in all_tools]
-        
-        # Ensure essential tools are always available if they exist in all_tools
-        required_tool_names = ["search_products", "get_product_details", "list_product_categories"]
-        for req_tool in required_tool_names:
-            if req_tool in all_tools and req_tool not in active_tools:
-                filtered_tools.append(all_tools[req_tool])
-        
-        # Create agent with the filtered tools
-        agent = create_openai_tools_agent(llm, filtered_tools, custom_prompt)
-        agent_executor = AgentExecutor(
+    tool_names = _enabled_tool_names(active_tools)
+    
+    agent_executor = _EXECUTORS.get(tool_names)
+    if agent_executor is None:
+        # Keep all_tools order so the tool schema sent to the model is stable
+        filtered_tools = [all_tools[name] for name in all_tools if name in tool_names]
+        agent = create_openai_tools_agent(_LLM, filtered_tools, custom_prompt)
+        agent_executor = DedupAgentExecutor(
             agent=agent, 
             tools=filtered_tools,
             verbose=False,
             handle_parsing_errors=True,
-            max_iterations=5 # Add max iterations to prevent long loops
+            # Ceiling for recommendation turns; DedupAgentExecutor keeps the rest at MAX_ITERATIONS
+            max_iterations=RECOMMENDATION_MAX_ITERATIONS
         )
+        _EXECUTORS[tool_names] = agent_executor
+    
+    return agent_executor
+
+def _respond_category_products(match: re.Match) -> Optional[str]:
+    # Only route names that are actual categories; anything else goes to the agent
+    requested = match.group(1).strip().lower()
+    version = _catalog_version()
+    for category in utils.get_category_count():
+        if str(category).lower() == requested:
+            # The tool returns JSON for the model, so answer with the readable listing
+            return _category_products_text_cached(str(category), version)
+    return None
+
+# Navigational queries answered directly, skipping the LLM round trip. Each entry is
+# (pattern, tool the answer stands in for, responder returning the answer or None).
+_ROUTER = [
+    (re.compile(r"^\s*(?:list|show)?\s*(?:me\s+)?(?:all\s+)?(?:the\s+)?(?:product\s+)?categor(?:y|ies)\s*[?.!]?\s*$", re.IGNORECASE),
+     "list_product_categories", lambda match: list_product_categories.invoke({})),
+    (re.compile(r"^\s*(?:show\s+(?:me\s+)?)?(?:all\s+)?products?\s+in\s+(?:the\s+)?(.+?)(?:\s+category)?\s*[?.!]?\s*$", re.IGNORECASE),
+     "get_category_products", _respond_category_products),
+    (re.compile(r"^\s*(?:show\s+(?:me\s+)?)?(?:the\s+)?(?:details\s+(?:for|of|on)\s+)?product\s+(?:id\s*)?#?(\d+)\s*[?.!]?\s*$", re.IGNORECASE),
+     "get_product_details", lambda match: _product_details_text_cached(int(match.group(1)), _catalog_version())),
+]
+
+def _route_query(query: str, tool_names: frozenset) -> Optional[str]:
+    """
+    Answer a query directly with a tool when it matches a known navigational intent.
+    
+    Args:
+        query: The user's query
+        tool_names: Names of the tools enabled for this turn
+    
+    Returns:
+        The tool output, or None if the query should go to the agent
+    """
+    for pattern, tool_name, respond in _ROUTER:
+        match = pattern.match(query)
+        if match is None or tool_name not in tool_names:
+            continue
+        response = respond(match)
+        if response is not None:
+            return response
+    return None
+
+# Opening questions this similar (cosine) to an earlier one reuse its answer
+SEMANTIC_CACHE_THRESHOLD = 0.95
+# Cached answers kept per tool set and catalog version
+SEMANTIC_CACHE_SIZE = 256
+SEMANTIC_CACHE_MODEL = "all-MiniLM-L6-v2"
+
+# Numbers in a query ("under $50" vs "under $500") must match exactly: the embeddings
+# of such queries are nearly identical
+_NUMBER_PATTERN = re.compile(r"\d+(?:\.\d+)?")
+
+class SemanticResponseCache:
+    """
+    Agent responses looked up by the embedding similarity of the query.
+    
+    Entries are grouped by (enabled tool names, catalog version, numbers in the
+    query) so answers are never shared across tool sets, served from a reloaded
+    catalog or reused for a different price or quantity.
+    """
+    
+    def __init__(self, model_name: str, threshold: float, max_entries: int):
+        self.model_name = model_name
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._model = None
+        self._disabled = False
+        self._lock = threading.Lock()
+        # key -> (query embeddings stacked row-wise, responses in the same order)
+        self._entries: Dict[tuple, tuple] = {}
+    
+    def _embed(self, query: str) -> Optional[np.ndarray]:
+        with self._lock:
+            if self._model is None and not self._disabled:
+                try:
+                    from sentence_transformers import SentenceTransformer
+                    self._model = SentenceTransformer(self.model_name)
+                except Exception as e:
+                    print(f"Semantic response cache disabled: {e}")
+                    self._disabled = True
+        if self._model is None:
+            return None
+        return self._model.encode([query.strip().lower()], normalize_embeddings=True)[0]
+    
+    def get(self, query: str, key: tuple) -> tuple:
+        """
+        Find the cached response for the query.
+        
+        Returns:
+            (response or None, query embedding to pass to put)
+        """
+        embedding = self._embed(query)
+        if embedding is None:
+            return None, None
+        with self._lock:
+            embeddings, responses = self._entries.get(key, (None, []))
+        if not responses:
+            return None, embedding
+        scores = embeddings @ embedding
+        best = int(np.argmax(scores))
+        return (responses[best] if scores[best] >= self.threshold else None), embedding
+    
+    def put(self, embedding: Optional[np.ndarray], key: tuple, response: str) -> None:
+        if embedding is None:
+            return
+        with self._lock:
+            embeddings, responses = self._entries.get(key, (np.empty((0, embedding.shape[0]), dtype=embedding.dtype), []))
+            # Drop the oldest entries once the cache is full
+            embeddings = np.vstack([embeddings, embedding])[-self.max_entries:]
+            responses = (responses + [response])[-self.max_entries:]
+            self._entries[key] = (embeddings, responses)
+
+_RESPONSE_CACHE = SemanticResponseCache(SEMANTIC_CACHE_MODEL, SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_SIZE)
+
+# Follow-up answers, reused only for the same query after the same recent turns
+FOLLOW_UP_CACHE_SIZE = 512
+FOLLOW_UP_HISTORY_MESSAGES = 6
+_FOLLOW_UP_RESPONSES: "OrderedDict[bytes, str]" = OrderedDict()
+_FOLLOW_UP_LOCK = threading.Lock()
+
+def _store_answer(store: Callable[[str], None], response: str) -> None:
+    """Cache the response only if the current run ended in a real final answer"""
+    status = _RUN_STATUS.get()
+    if status is not None and not status.get("stopped") and not status.get("parse_error"):
+        store(response)
+
+def _normalize_text(text: Any) -> str:
+    return " ".join(str(text).lower().split())
+
+def _follow_up_key(query: str, chat_history: List, tool_names: frozenset) -> bytes:
+    """Digest of the normalized query and recent history, the tool set and the catalog version"""
+    recent = [
+        (getattr(message, "type", None), _normalize_text(getattr(message, "content", message)))
+        for message in chat_history[-FOLLOW_UP_HISTORY_MESSAGES:]
+    ]
+    payload = json.dumps([_normalize_text(query), recent, sorted(tool_names), _catalog_version()])
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).digest()
+
+def _store_follow_up(key: bytes, response: str) -> None:
+    with _FOLLOW_UP_LOCK:
+        _FOLLOW_UP_RESPONSES[key] = response
+        _FOLLOW_UP_RESPONSES.move_to_end(key)
+        while len(_FOLLOW_UP_RESPONSES) > FOLLOW_UP_CACHE_SIZE:
+            _FOLLOW_UP_RESPONSES.popitem(last=False)
+
+def _lookup_response(query: str, chat_history: List, tool_names: frozenset) -> Tuple[Optional[str], Callable[[str], None]]:
+    """
+    Look up a cached answer for the turn.
+    
+    Opening questions match earlier ones by embedding similarity. Follow-ups depend
+    on the earlier turns, so they only match the same query after the same last
+    FOLLOW_UP_HISTORY_MESSAGES messages.
+    
+    Args:
+        query: The user's query
+        chat_history: The chat history as a list of messages
+        tool_names: Names of the tools enabled for this turn
+    
+    Returns:
+        The cached response or None, and a function that stores the response otherwise computed
+    """
+    # The current query may already be the last message of the history
+    if sum(1 for message in chat_history if getattr(message, "type", None) == "human") <= 1:
+        key = (tool_names, _catalog_version(), tuple(_NUMBER_PATTERN.findall(query)))
+        response, embedding = _RESPONSE_CACHE.get(query, key)
+        return response, partial(_store_answer, partial(_RESPONSE_CACHE.put, embedding, key))
+    
+    key = _follow_up_key(query, chat_history, tool_names)
+    with _FOLLOW_UP_LOCK:
+        response = _FOLLOW_UP_RESPONSES.get(key)
+        if response is not None:
+            _FOLLOW_UP_RESPONSES.move_to_end(key)
+    return response, partial(_store_answer, partial(_store_follow_up, key))
+
+def _agent_error_message(error: Exception) -> str:
+    """Turn an agent failure into a user-facing message"""
+    error_message = f"I encountered an error while processing your request: {str(error)}"
+    print(f"Agent error: {str(error)}")
+    # Provide more specific feedback for common errors if possible
+    if "quota" in str(error).lower():
+        error_message = "Apologies, I seem to be quite popular right now and reached my processing limit. Please try again in a moment. ⏳"
+    return error_message
+
+def stream_agent_interaction(query: str, chat_history: List, active_tools: Sequence[str]) -> Iterator[str]:
+    """
+    Run the agent with the given query, chat history, and active tools, yielding
+    the answer token by token as the model generates it.
+    
+    Synchronous bridge over astream_agent_interaction: the async run executes on
+    its own event loop in a worker thread and hands each piece over through a queue.
+    
+    Args:
+        query: The user's query
+        chat_history: The chat history as a list of messages
+        active_tools: Names of the tools that are currently enabled
+    
+    Yields:
+        Pieces of the agent's response; joined together they form the full response
+    """
+    pieces: "queue.Queue[Optional[str]]" = queue.Queue()
+    
+    async def produce() -> None:
+        try:
+            async for piece in astream_agent_interaction(query, chat_history, active_tools):
+                pieces.put(piece)
+        finally:
+            # None marks the end of the response
+            pieces.put(None)
+    
+    threading.Thread(target=asyncio.run, args=(produce(),), daemon=True).start()
+    while (piece := pieces.get()) is not None:
+        yield piece
+
+async def astream_agent_interaction(query: str, chat_history: List, active_tools: Sequence[str]) -> AsyncIterator[str]:
+    """
+    Run the agent, yielding the answer token by token as the model generates it.
+    When the model requests several tools in one step, the async executor runs
+    those tool calls concurrently.
+    
+    Args:
+        query: The user's query
+        chat_history: The chat history as a list of messages
+        active_tools: Names of the tools that are currently enabled
+    
+    Yields:
+        Pieces of the agent's response; joined together they form the full response
+    """
+    try:
+        # Answer simple navigational queries without calling the LLM
+        tool_names = _enabled_tool_names(active_tools)
+        routed_response = _route_query(query, tool_names)
+        if routed_response is not None:
+            yield routed_response
+            return
+        
+        # Reuse an earlier answer to the same question (the query embedding runs off the loop)
+        loop = asyncio.get_running_loop()
+        cached_response, store_response = await loop.run_in_executor(_POOL, _lookup_response, query, chat_history, tool_names)
+        if cached_response is not None:
+            yield cached_response
+            return
         
-        # Run the agent
-        result = agent_executor.invoke({
-            "input": query,
-            "chat_history": chat_history
-        })
+        # Reuse the executor for this tool set (built once per distinct set)
+        agent_executor = _get_agent_executor(active_tools)
         
-        return result["output"]
+        # Run the agent, passing the model's answer on token by token. AgentExecutor.astream
+        # only yields whole steps, so the tokens are taken from the run's event stream.
+        answer = None
+        streamed = False
+        status_token = _RUN_STATUS.set({})
+        try:
+            async for event in agent_executor.astream_events({
+                "input": query,
+                "chat_history": chat_history
+            }, version="v2"):
+                if event["event"] == "on_chat_model_stream":
+                    chunk = event["data"]["chunk"]
+                    # Tool-call deltas (the model choosing a tool) are not part of the answer
+                    if getattr(chunk, "tool_call_chunks", None) or not isinstance(chunk.content, str) or not chunk.content:
+                        continue
+                    streamed = True
+                    yield chunk.content
+                elif event["event"] == "on_chain_end" and not event.get("parent_ids"):
+                    # The executor's own end event carries the complete final answer
+                    answer = (event["data"].get("output") or {}).get("output")
+            
+            # Answers the model did not generate (the executor's stopped message) arrive whole
+            if answer and not streamed:
+                yield answer
+            if answer:
+                store_response(answer)
+        finally:
+            _RUN_STATUS.reset(status_token)
     
     except Exception as e:
-        error_message = f"I encountered an error while processing your request: {str(e)}"
-        print(f"Agent error: {str(e)}")
-        # Provide more specific feedback for common errors if possible
-        if "quota" in str(e).lower():
-            error_message = "Apologies, I seem to be quite popular right now and reached my processing limit. Please try again in a moment. ⏳"
-        return error_message
+        yield _agent_error_message(e)
+
+def run_agent_interaction(query: str, chat_history: List, active_tools: Sequence[str]) -> str:
+    """
+    Run the agent with the given query, chat history, and active tools.
+    
+    Args:
+        query: The user's query
+        chat_history: The chat history as a list of messages
+        active_tools: Names of the tools that are currently enabled
+    
+    Returns:
+        The agent's response as a string
+    """
+    return "".join(stream_agent_interaction(query, chat_history, active_tools))
 
 if __name__ == "__main__":
     # Simple command-line test
@@ -401,14 +935,17 @@ if __name__ == "__main__":
             # Add to chat history
             chat_history.append(HumanMessage(content=user_input))
             
-            # Run agent interaction with all tools enabled for testing
-            response = run_agent_interaction(user_input, chat_history, list(all_tools.keys()))
+            # Run agent interaction with all tools enabled for testing,
+            # printing the response as it arrives
+            print("\nShopSight: ", end="", flush=True)
+            response = ""
+            for chunk in stream_agent_interaction(user_input, chat_history, list(all_tools.keys())):
+                print(chunk, end="", flush=True)
+                response += chunk
+            print()
             
             # Add agent response to chat history
             chat_history.append(AIMessage(content=response))
-            
-            # Print agent response
-            print(f"\nShopSight: {response}")
     except KeyboardInterrupt:
         print("\nExiting ShopSight Agent Test...")
     except Exception as e:
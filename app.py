@@ -1,15 +1,13 @@
 import streamlit as st
-import tempfile
+import asyncio
+import threading
 from pathlib import Path
-import os
 import google.generativeai as genai
 from langchain_core.messages import HumanMessage, AIMessage
-import base64
-import requests
+import numpy as np
 import pandas as pd
 import random
-import json
-from datetime import datetime
+from types import SimpleNamespace
 
 import agent_core
 import utils
@@ -22,437 +20,121 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Custom CSS for premium styling
-st.markdown("""
-<style>
-    /* Main theme colors */
-    :root {
-        --primary-color: #2196F3;
-        --secondary-color: #4CAF50;
-        --accent-color: #FFC107;
-        --background-color: #f8f9fa;
-        --card-color: #ffffff;
-        --text-color: #212121;
-        --text-light: #757575;
-        --border-radius: 10px;
-        --box-shadow: 0 2px 10px rgba(0,0,0,0.1);
-    }
-    
-    /* Global styles */
-    .main {
-        background-color: var(--background-color);
-    }
-    .stApp {
-        max-width: 1200px;
-        margin: 0 auto;
-    }
-    
-    /* Chat message styling */
-    .chat-message {
-        padding: 1.5rem;
-        border-radius: var(--border-radius);
-        margin-bottom: 1rem;
-        display: flex;
-        box-shadow: var(--box-shadow);
-    }
-    .chat-message.user {
-        background-color: #e6f3ff;
-        border-left: 5px solid var(--primary-color);
-    }
-    .chat-message.assistant {
-        background-color: #f0f7f0;
-        border-left: 5px solid var(--secondary-color);
-    }
-    .chat-avatar {
-        width: 60px;
-    }
-    .chat-content {
-        flex-grow: 1;
-        padding-left: 1rem;
-    }
-    
-    /* Button styling */
-    .stButton button {
-        background-color: var(--primary-color);
-        color: white;
-        border-radius: 20px;
-        padding: 0.5rem 2rem;
-        font-weight: bold;
-        transition: all 0.3s ease;
-    }
-    .stButton button:hover {
-        transform: translateY(-2px);
-        box-shadow: 0 4px 8px rgba(0,0,0,0.2);
-    }
-    
-    /* Headings */
-    h1, h2, h3 {
-        color: #1E3A8A;
-    }
-    h1 {
-        font-size: 2.2rem;
-        margin-bottom: 1rem;
-    }
-    h2 {
-        font-size: 1.8rem;
-        margin-bottom: 0.8rem;
-    }
-    h3 {
-        font-size: 1.5rem;
-        margin-bottom: 0.6rem;
-    }
-    
-    /* Footer */
-    .footer {
-        margin-top: 3rem;
-        text-align: center;
-        color: var(--text-light);
-        padding: 1rem;
-        border-top: 1px solid #eee;
-    }
-    
-    /* Category cards */
-    .category-card {
-        background-color: var(--card-color);
-        border-radius: var(--border-radius);
-        padding: 20px;
-        box-shadow: var(--box-shadow);
-        transition: transform 0.3s ease-in-out, box-shadow 0.3s ease-in-out;
-        text-align: center;
-        display: flex;
-        flex-direction: column;
-        justify-content: center;
-        align-items: center;
-        min-height: 150px;
-    }
-    div[data-testid="stVerticalBlock"] > div[style*="flex-direction: column;"] > div[data-testid="stVerticalBlockBorderWrapper"]:has(.category-card) {
-        margin-bottom: 10px;
-    }
-    .category-card:hover {
-        transform: translateY(-5px);
-        box-shadow: 0 5px 15px rgba(0,0,0,0.2);
-    }
-    .category-icon {
-        font-size: 2.5rem;
-        margin-bottom: 15px;
-        color: var(--primary-color);
-    }
-    
-    /* Filter section */
-    .filter-section {
-        background-color: var(--card-color);
-        border-radius: var(--border-radius);
-        padding: 20px;
-        box-shadow: var(--box-shadow);
-        margin-bottom: 20px;
-    }
-    
-    /* Product cards */
-    .product-card-container {
-        padding: 15px;
-        background-color: var(--card-color);
-        border-radius: var(--border-radius);
-        box-shadow: var(--box-shadow);
-        height: 100%;
-        display: flex;
-        flex-direction: column;
-        justify-content: space-between;
-        border: 1px solid #eee;
-        transition: box-shadow 0.3s ease;
-    }
-    .product-card-container:hover {
-        box-shadow: 0 4px 15px rgba(0,0,0,0.15);
-    }
-    .product-card-container img {
-        border-radius: calc(var(--border-radius) - 8px);
-        margin-bottom: 15px;
-        max-height: 180px;
-        object-fit: contain;
-    }
-    .product-info-section {
-        flex-grow: 1;
-        margin-bottom: 15px;
-    }
-    .product-info-section h4 {
-        font-size: 1.1rem;
-        font-weight: 600;
-        margin-bottom: 5px;
-        color: var(--text-color);
-    }
-    .product-info-section .caption {
-        font-size: 0.85rem;
-        color: var(--text-light);
-        margin-bottom: 10px;
-        display: block;
-    }
-    .product-info-section .price {
-        font-size: 1.25rem;
-        font-weight: 700;
-        color: var(--primary-color);
-        margin-bottom: 10px;
-        display: block;
-    }
-    .product-info-section .rating {
-        font-size: 0.9rem;
-        color: var(--text-light);
-        margin-bottom: 10px;
-    }
-    .product-info-section .rating .stars {
-        color: var(--accent-color);
-        margin-right: 5px;
-        font-size: 1rem;
-    }
-    .product-action-section {
-        padding-top: 10px;
-        border-top: 1px solid #eee;
-    }
-    
-    /* Product cards */
-    .product-card {
-        background-color: var(--card-color);
-        border-radius: var(--border-radius);
-        overflow: hidden;
-        box-shadow: var(--box-shadow);
-        transition: transform 0.3s ease, box-shadow 0.3s ease;
-        height: 100%;
-        display: flex;
-        flex-direction: column;
-    }
-    .product-card:hover {
-        transform: translateY(-5px);
-        box-shadow: 0 8px 15px rgba(0,0,0,0.1);
-    }
-    .product-img {
-        height: 200px;
-        background-color: #f5f5f5;
-        display: flex;
-        align-items: center;
-        justify-content: center;
-        overflow: hidden;
-    }
-    .product-img img {
-        width: 100%;
-        height: 100%;
-        object-fit: contain;
-    }
-    .product-info {
-        padding: 15px;
-        flex-grow: 1;
-        display: flex;
-        flex-direction: column;
-    }
-    .product-title {
-        font-weight: 600;
-        margin-bottom: 10px;
-        color: var(--text-color);
-        font-size: 1.1rem;
-    }
-    .product-category {
-        font-size: 0.9rem;
-        color: var(--text-light);
-        margin-bottom: 10px;
-    }
-    .product-price {
-        font-weight: 700;
-        color: var(--primary-color);
-        font-size: 1.2rem;
-        margin-bottom: 15px;
-    }
-    .product-rating {
-        display: flex;
-        align-items: center;
-        margin-bottom: 15px;
-    }
-    .product-rating .stars {
-        color: var(--accent-color);
-        margin-right: 5px;
-    }
-    .product-actions {
-        margin-top: auto;
-        display: flex;
-        gap: 10px;
-    }
-    .product-btn {
-        flex: 1;
-        background-color: var(--primary-color);
-        color: white;
-        border: none;
-        padding: 8px 0;
-        border-radius: 5px;
-        cursor: pointer;
-        font-weight: 500;
-        transition: background-color 0.3s ease;
-    }
-    .product-btn.secondary {
-        background-color: #f5f5f5;
-        color: var(--text-color);
-    }
-    .product-btn:hover {
-        opacity: 0.9;
-    }
-    
-    /* Badge styles */
-    .badge {
-        display: inline-block;
-        padding: 4px 8px;
-        border-radius: 4px;
-        font-size: 0.75rem;
-        font-weight: 600;
-        margin-right: 5px;
-        margin-bottom: 5px;
-    }
-    .badge.new {
-        background-color: var(--primary-color);
-        color: white;
-    }
-    .badge.sale {
-        background-color: #F44336;
-        color: white;
-    }
-    .badge.popular {
-        background-color: var(--accent-color);
-        color: black;
-    }
+# Custom CSS for premium styling, read from disk once per process
+@st.cache_data
+def _css() -> str:
+    return (Path(__file__).parent / "static" / "styles.css").read_text(encoding="utf-8")
+
+st.markdown(f"<style>{_css()}</style>", unsafe_allow_html=True)
+
+# Load the product catalog once and precompute everything the UI reads from it
+@st.cache_resource(show_spinner=False, max_entries=1)
+def _catalog(version: int) -> SimpleNamespace:
+    """
+    Build the catalog summaries shared by all sessions.
     
-    /* Advanced filtering */
-    .filter-chip {
-        display: inline-block;
-        background-color: #e0e0e0;
-        color: var(--text-color);
-        padding: 5px 10px;
-        border-radius: 20px;
-        margin-right: 5px;
-        margin-bottom: 5px;
-        font-size: 0.9rem;
-    }
-    .filter-chip.active {
-        background-color: var(--primary-color);
-        color: white;
-    }
+    Args:
+        version: utils.PRODUCTS_VERSION, so a reloaded CSV gets a fresh catalog
     
-    /* Tabs styling */
-    .stTabs [data-baseweb="tab-list"] {
-        gap: 8px;
-    }
-    .stTabs [data-baseweb="tab"] {
-        height: 50px;
-        white-space: pre-wrap;
-        background-color: white;
-        border-radius: 4px 4px 0 0;
-        gap: 1rem;
-        padding-top: 10px;
-        padding-bottom: 10px;
-    }
-    .stTabs [aria-selected="true"] {
-        background-color: var(--primary-color) !important;
-        color: white !important;
-    }
+    Returns:
+        SimpleNamespace with df, columns, categories, sorted_categories, top_categories,
+        category_counts, min_price, max_price and brands
+    """
+    df = utils.load_products_data()
+    catalog = SimpleNamespace(df=df, columns={}, categories=[], sorted_categories=[], top_categories=[],
+                              category_counts={}, min_price=0, max_price=1000, brands=[])
+    if df.empty:
+        return catalog
     
-    /* Progress bar */
-    .stProgress > div > div {
-        background-color: var(--primary-color);
-    }
+    # Card fields as one numpy array per column, in the frame's row order, so rendering
+    # indexes arrays by position instead of boxing a row object per product
+    card_defaults = {'name': 'Unknown Product', 'category': 'N/A', 'brand': 'N/A'}
+    catalog.columns = {
+        'id': df['id'].to_numpy(),
+        'price': df['price'].fillna(0.0).to_numpy(np.float32),
+        'rating': (df['rating'].fillna(0.0) if 'rating' in df.columns else pd.Series(0.0, index=df.index)).to_numpy(np.float32),
+    }
+    for column, default in card_defaults.items():
+        values = df[column].astype(object).fillna(default) if column in df.columns else pd.Series(default, index=df.index)
+        catalog.columns[column] = values.to_numpy(dtype=object)
     
-    /* Sidebar styling */
-    [data-testid="stSidebar"] {
-        background-color: #f0f2f5;
-        border-right: 1px solid #eaeaea;
-    }
-    [data-testid="stSidebar"] [data-testid="stImage"] {
-        text-align: center;
-        display: block;
-        margin: 0 auto;
-    }
-    [data-testid="stExpander"] {
-        background-color: white;
-        border-radius: var(--border-radius);
-        margin-bottom: 1rem;
-        box-shadow: var(--box-shadow);
-    }
+    # Card badges: NEW for the latest product ids, POPULAR for top-rated products
+    catalog.columns['is_new'] = (pd.to_numeric(df['id'], errors='coerce') > 1030).fillna(False).to_numpy(dtype=bool)
+    catalog.columns['is_popular'] = (df['rating'] >= 4.7).fillna(False).to_numpy(dtype=bool) if 'rating' in df.columns else np.zeros(len(df), dtype=bool)
     
-    /* Ensure cards in columns have consistent height */
-    .stVerticalBlock > [data-testid="stVerticalBlockBorderWrapper"] > div > [data-testid="stVerticalBlock"] {
-        height: 100%;
-    }
-    .product-card-container {
-        height: 100%;
-        display: flex;
-    }
-</style>
-""", unsafe_allow_html=True)
+    catalog.categories = df['category'].unique().tolist()
+    catalog.sorted_categories = sorted(catalog.categories)
+    # Shown as quick category buttons once the conversation has started
+    catalog.top_categories = catalog.sorted_categories[:8]
+    catalog.category_counts = df['category'].value_counts().to_dict()
+    if 'price' in df.columns and not df['price'].isnull().all():
+        min_price, max_price = df['price'].agg(['min', 'max'])
+        catalog.min_price, catalog.max_price = float(min_price), float(max_price)
+    if 'brand' in df.columns:
+        catalog.brands = df['brand'].dropna().unique().tolist()
+    return catalog
+
+def load_catalog() -> SimpleNamespace:
+    # load_products_data is cheap when the CSV is unchanged and bumps the version when it changed
+    utils.load_products_data()
+    return _catalog(utils.PRODUCTS_VERSION)
 
-# Load product data for category display
-@st.cache_data
 def load_product_categories():
     try:
-        # Use the centralized loading function
-        df = utils.load_products_data()
-        if df.empty:
+        catalog = load_catalog()
+        if catalog.df.empty:
             st.warning("Product data is currently empty or could not be loaded.")
-            return [], {}
-            
-        categories = df['category'].unique().tolist()
-        category_counts = df['category'].value_counts().to_dict()
-        return categories, category_counts
+        return catalog.categories, catalog.category_counts
     except Exception as e:
         st.error(f"Error processing product categories: {str(e)}")
         return [], {}
 
-@st.cache_data
 def load_product_price_range():
     try:
-        # Use the centralized loading function
-        df = utils.load_products_data()
-        if df.empty or 'price' not in df.columns or df['price'].isnull().all():
+        catalog = load_catalog()
+        if catalog.df.empty or 'price' not in catalog.df.columns:
              st.warning("Product price data is currently empty or could not be loaded.")
-             return 0, 1000 # Return default range
-             
-        # Calculate min/max after ensuring data is present and numeric
-        min_price = float(df['price'].min())
-        max_price = float(df['price'].max())
-        return min_price, max_price
+        return catalog.min_price, catalog.max_price
     except Exception as e:
         st.error(f"Error processing product price range: {str(e)}")
         return 0, 1000
 
-@st.cache_data
 def load_product_brands():
     try:
-        # Use the centralized loading function
-        df = utils.load_products_data()
-        if df.empty or 'brand' not in df.columns:
+        catalog = load_catalog()
+        if catalog.df.empty or 'brand' not in catalog.df.columns:
              st.warning("Product brand data is currently empty or could not be loaded.")
-             return []
-             
-        brands = df['brand'].dropna().unique().tolist()
-        return brands
+        return catalog.brands
     except Exception as e:
         st.error(f"Error processing product brands: {str(e)}")
         return []
 
-# Get warm greeting messages
+# Warm greeting messages
+GREETINGS = (
+    "Hello! I'm ShopSight, your friendly AI shopping assistant. How can I help you discover the perfect products today?",
+    "Welcome to ShopSight! I'm here to make your shopping experience delightful. What can I help you find today?",
+    "Hi there! I'm your personal ShopSight assistant, ready to help with all your shopping needs. What are you looking for today?",
+    "Greetings! I'm ShopSight, your AI shopping companion. I'd be happy to help you find exactly what you need today!",
+    "Welcome! I'm ShopSight, and I'm excited to help you discover amazing products. How can I assist you today?",
+)
+
 def get_random_greeting():
-    greetings = [
-        "Hello! I'm ShopSight, your friendly AI shopping assistant. How can I help you discover the perfect products today?",
-        "Welcome to ShopSight! I'm here to make your shopping experience delightful. What can I help you find today?",
-        "Hi there! I'm your personal ShopSight assistant, ready to help with all your shopping needs. What are you looking for today?",
-        "Greetings! I'm ShopSight, your AI shopping companion. I'd be happy to help you find exactly what you need today!",
-        "Welcome! I'm ShopSight, and I'm excited to help you discover amazing products. How can I assist you today?"
-    ]
-    return random.choice(greetings)
+    return random.choice(GREETINGS)
 
-# Get random featured products
-@st.cache_data
-def get_featured_products(n=8):
+# Number of products shown in the Featured Products grid
+FEATURED_COUNT = 8
+
+# Get the catalog row positions of the featured products picked for this session
+def get_featured_positions(catalog):
     try:
-        # Use the centralized loading function to ensure consistency
-        df = utils.load_products_data()
-        if df.empty or len(df) <= n:
-            return df
-        return df.sample(n=n)
+        if catalog.df.empty:
+            return np.empty(0, dtype=np.intp)
+        # The frame is indexed by product id; skip ids no longer in a reloaded catalog
+        positions = catalog.df.index.get_indexer(st.session_state.featured_ids)
+        return positions[positions >= 0]
     except Exception as e:
         st.error(f"Error loading featured products: {str(e)}")
-        return pd.DataFrame()
+        return np.empty(0, dtype=np.intp)
 
 # Category icons mapping
 category_icons = {
@@ -478,12 +160,17 @@ category_icons = {
 # Default icon for categories not in the mapping
 default_icon = '��'
 
-# Load API keys
-try:
+# Load API keys and configure Gemini once per process (failures are not cached, so they surface on every rerun)
+@st.cache_resource(show_spinner=False)
+def _configure_genai():
     api_keys = utils.load_api_keys()
     
     # Set Google API key for Gemini
     genai.configure(api_key=api_keys["GOOGLE_API_KEY"])
+    return api_keys
+
+try:
+    api_keys = _configure_genai()
     
 except Exception as e:
     st.error(f"Error loading API keys: {str(e)}")
@@ -526,24 +213,47 @@ if "filter_params" not in st.session_state:
 if "view_mode" not in st.session_state:
     st.session_state.view_mode = "grid"
 
+# Pick the featured products once per session so reruns reuse them instead of resampling
+if "featured_ids" not in st.session_state:
+    catalog_df = load_catalog().df
+    st.session_state.featured_ids = catalog_df.sample(n=min(FEATURED_COUNT, len(catalog_df))).index.tolist()
+
 # --- Agent Interaction Function ---
+# Cap on agent runs in flight across all sessions served by this process
+MAX_CONCURRENT_AGENT_RUNS = 8
+
+@st.cache_resource(show_spinner=False)
+def _agent_slots() -> threading.BoundedSemaphore:
+    # Streamlit re-executes this script on every rerun, so the semaphore is created
+    # once here and shared by every session instead of living at module level
+    return threading.BoundedSemaphore(MAX_CONCURRENT_AGENT_RUNS)
+
+async def _stream_agent_response(query: str, active_tools: tuple, placeholder) -> str:
+    """Stream the agent's response into the placeholder as it arrives and return the full text."""
+    response_text = ""
+    async for chunk in agent_core.astream_agent_interaction(
+        query, st.session_state.chat_history, active_tools
+    ):
+        response_text += chunk
+        placeholder.markdown(response_text)
+    return response_text
+
 def run_agent_query(query: str):
-    """Adds user query to chat, runs agent, adds response, reruns."""
+    """Adds user query to chat, streams the agent's response, adds it, reruns."""
     st.session_state.chat_history.append(HumanMessage(content=query))
-    with st.spinner("Thinking..."):
-        try:
-            active_tools = [k for k, v in st.session_state.tools_enabled.items() if v]
-            agent_response_text = agent_core.run_agent_interaction(
-                query, st.session_state.chat_history, active_tools
-            )
-        except Exception as e:
-            agent_response_text = f"I encountered an error: {str(e)}. Please try again."
-        st.session_state.chat_history.append(AIMessage(content=agent_response_text))
-    # Use st.experimental_rerun() if st.rerun() causes issues, otherwise keep st.rerun()
+    with st.chat_message("assistant", avatar="🤖"):
+        placeholder = st.empty()
+    placeholder.markdown("Thinking...")
     try:
-        st.rerun()
-    except Exception:
-        st.experimental_rerun()
+        # Sorted tuple so the same toggles always give the same hashable key
+        active_tools = tuple(sorted(k for k, v in st.session_state.tools_enabled.items() if v))
+        with _agent_slots():
+            agent_response_text = asyncio.run(_stream_agent_response(query, active_tools, placeholder))
+    except Exception as e:
+        agent_response_text = f"I encountered an error: {str(e)}. Please try again."
+    st.session_state.chat_history.append(AIMessage(content=agent_response_text))
+    # st.rerun is stable in the pinned Streamlit (>= 1.27), so no experimental_rerun fallback
+    st.rerun()
 
 # --- UI Rendering & Callback Functions ---
 
@@ -552,56 +262,69 @@ def handle_details_click(product_id):
     query = f"Show details for product ID {product_id}"
     run_agent_query(query)
 
+# Width and height of the product card images
+CARD_IMAGE_SIZE = (600, 400)
+
+# Card markup for a product (image, badges, title, caption, price and rating), built once per product
+@st.cache_data(show_spinner=False)
+def _card_html(product_id, name, price, rating, category, brand, is_new, is_popular, image_url, eager=False):
+    # Let the browser defer images below the fold; the first row loads right away
+    loading = "eager" if eager else "lazy"
+    # Fixed intrinsic size (matching the placeholder images) so the browser reserves the
+    # space up front and the grid does not reflow when a lazy image arrives
+    image_html = (f"<img src='{image_url}' width='{CARD_IMAGE_SIZE[0]}' height='{CARD_IMAGE_SIZE[1]}' "
+                  f"loading='{loading}' decoding='async' "
+                  f"style='width:100%;height:auto;max-height:180px;object-fit:contain;'>")
+    
+    badge_html = ""
+    if is_new: badge_html += "<span class='badge new'>NEW</span> "
+    if is_popular: badge_html += "<span class='badge popular'>POPULAR</span>"
+    
+    stars_html = f"<span class='stars'>{'★' * int(rating)}{'☆' * (5 - int(rating))}</span>"
+    # One self-contained element, so the .product-card-container rules in styles.css apply
+    return (
+        "<div class='product-card-container'>" +
+        image_html +
+        "<div class='product-info-section'>"
+        f"<div>{badge_html}</div>"
+        f"<h4>{name}</h4>"
+        f"<span class='caption'>{category} | {brand}</span>"
+        f"<span class='price'>${price:.2f}</span>"
+        f"<div class='rating'>{stars_html} ({rating:.1f})</div>"
+        "</div></div>"
+    )
+
 # Refactored Function to render product card with improved aesthetics (Moved Definition Earlier)
-def render_product_card(product, key_prefix):
-    product_id = product.get('id', f"unknown_{key_prefix}_{random.randint(1000,9999)}")
-    product_name = product.get('name', 'Unknown Product')
-    product_price = float(product.get('price', 0.0))
-    product_rating = float(product.get('rating', 0.0))
-    product_category = product.get('category', 'N/A')
-    product_brand = product.get('brand', 'N/A')
+def render_product_card(catalog, position, key_prefix, eager=False):
+    columns = catalog.columns
+    product_id = int(columns['id'][position])
+    product_name = columns['name'][position]
+    product_price = float(columns['price'][position])
+    product_rating = float(columns['rating'][position])
+    product_category = columns['category'][position]
+    product_brand = columns['brand'][position]
     
-    placeholder_url = f"https://placehold.co/600x400/e0e0e0/757575?text={product_name.split()[0]}"
+    placeholder_url = f"https://placehold.co/{CARD_IMAGE_SIZE[0]}x{CARD_IMAGE_SIZE[1]}/e0e0e0/757575?text={product_name.split()[0]}"
     
-    try: is_new = int(product_id) > 1030 
-    except: is_new = False
-    is_popular = product_rating >= 4.7
+    is_new = bool(columns['is_new'][position])
+    is_popular = bool(columns['is_popular'][position])
     
     with st.container():
-        st.markdown('<div class="product-card-container">', unsafe_allow_html=True)
-        st.image(placeholder_url, use_column_width='auto')
-        
-        # --- Info Section ---
-        badge_md = ""
-        if is_new: badge_md += "<span class='badge new'>NEW</span> "
-        if is_popular: badge_md += "<span class='badge popular'>POPULAR</span>"
-        if badge_md: st.markdown(badge_md, unsafe_allow_html=True)
-
-        st.markdown(f"<h4>{product_name}</h4>", unsafe_allow_html=True)
-        st.markdown(f"<span class='caption'>{product_category} | {product_brand}</span>", unsafe_allow_html=True)
-        st.markdown(f"<span class='price'>${product_price:.2f}</span>", unsafe_allow_html=True)
-
-        stars_html = f"<span class='stars'>{'★' * int(product_rating)}{'☆' * (5 - int(product_rating))}</span>"
-        st.markdown(f"<div class='rating'>{stars_html} ({product_rating:.1f})</div>", unsafe_allow_html=True)
-        # --- End Info Section ---
+        # --- Image & Info Section (one cached markdown per card) ---
+        st.markdown(_card_html(product_id, product_name, product_price, product_rating,
+                               product_category, product_brand, is_new, is_popular,
+                               placeholder_url, eager),
+                    unsafe_allow_html=True)
 
         # --- Action Section (Only Details button) ---
-        st.markdown('<div class="product-action-section">', unsafe_allow_html=True)
         st.button("Details", 
                   key=f"details_{key_prefix}_{product_id}",
                   on_click=handle_details_click,
                   args=(product_id,),
                   use_container_width=True)
-        st.markdown('</div>', unsafe_allow_html=True)
-
-        st.markdown('</div>', unsafe_allow_html=True)
 
-# --- Category Click Handlers ---
+# --- Category Click Handler (category cards and quick category buttons) ---
 def handle_category_click(category_name):
-     query = f"Show me products in the {category_name} category"
-     run_agent_query(query)
-
-def handle_quick_category_click(category_name):
     query = f"Show me products in the {category_name} category"
     run_agent_query(query)
 
@@ -610,6 +333,19 @@ def handle_chat_input():
     if st.session_state.user_input:
         run_agent_query(st.session_state.user_input)
 
+# --- Chat Rendering ---
+# Number of most recent chat messages shown directly
+CHAT_PAGE_SIZE = 20
+
+def render_chat_messages(messages):
+    for message in messages:
+        if message.type == "human":
+            with st.chat_message("user", avatar="👤"):
+                st.markdown(message.content)
+        else:
+            with st.chat_message("assistant", avatar="🤖"):
+                st.markdown(message.content)
+
 # --- Constants & Initializations ---
 # ... [category_icons, default_icon] ...
 
@@ -626,8 +362,16 @@ with st.sidebar:
 # --- Main Content Area ---
 st.header("🛍️ ShopSight AI Shopping Assistant")
 
+# Categories for both the category grid and the quick category buttons
+categories, category_counts = load_product_categories()
+catalog = load_catalog()
+
+# The welcome view (hero, featured products, category grid) is only built before the
+# conversation starts; afterwards those sections are skipped entirely on each rerun
+conversation_started = len(st.session_state.chat_history) > 1
+
 # Initial View (Welcome, Featured Products, Categories)
-if len(st.session_state.chat_history) <= 1:
+if not conversation_started:
     # Hero banner
     st.markdown("""
     <div style="background-color: #e0f2f1; padding: 20px; border-radius: 10px; margin-bottom: 20px; text-align: center;">
@@ -656,14 +400,15 @@ if len(st.session_state.chat_history) <= 1:
     # Show featured products if no filters applied
     if not active_filters:
         st.markdown("### 🌟 Featured Products")
-        featured_products_df = get_featured_products(n=8)
+        featured_positions = get_featured_positions(catalog)
         
-        if not featured_products_df.empty:
+        if len(featured_positions):
             cols = st.columns(4)
-            for i, (_, product_row) in enumerate(featured_products_df.iterrows()):
+            for i, position in enumerate(featured_positions):
                 with cols[i % 4]:
                     # Pass a unique key prefix for featured items
-                    render_product_card(product_row, f"feat_{i}")
+                    # Only the first row is above the fold
+                    render_product_card(catalog, position, f"feat_{i}", eager=i < 4)
         
         st.markdown("---")
     
@@ -675,20 +420,12 @@ if len(st.session_state.chat_history) <= 1:
     st.markdown("---")
 
 # Display categories only on the first page load or when no conversation has happened yet
-if len(st.session_state.chat_history) <= 1:
+if not conversation_started:
     st.markdown("### Explore Our Product Categories")
     
-    # Load categories data
-    categories, category_counts = load_product_categories()
-    
-    # Define handler function *before* the loop where it's used
-    def handle_category_click(category_name):
-         query = f"Show me products in the {category_name} category"
-         run_agent_query(query)
-         
     if categories:
         cols = st.columns(4)
-        for i, category in enumerate(sorted(categories)):
+        for i, category in enumerate(catalog.sorted_categories):
             col_idx = i % 4
             icon = category_icons.get(category, default_icon)
             count = category_counts.get(category, 0)
@@ -718,7 +455,7 @@ if len(st.session_state.chat_history) <= 1:
     st.markdown("I can help you find products, compare options, check availability, and more.")
 
 # Display shopping assistant header
-if len(st.session_state.chat_history) > 1:
+if conversation_started:
     st.markdown("""
     <div style="background-color: #e3f2fd; padding: 15px; border-radius: 10px; margin-bottom: 20px;">
         <h2 style="color: #1565c0; margin-bottom: 5px;">Your Shopping Assistant</h2>
@@ -726,38 +463,21 @@ if len(st.session_state.chat_history) > 1:
     </div>
     """, unsafe_allow_html=True)
 
-# Custom chat display
+# Chat display: the latest messages, older ones behind an expander
 chat_container = st.container()
 with chat_container:
-    for i, message in enumerate(st.session_state.chat_history):
-        if message.type == "human":
-            with st.container():
-                st.markdown(f"""
-                <div class="chat-message user">
-                    <div class="chat-avatar">👤</div>
-                    <div class="chat-content">{message.content}</div>
-                </div>
-                """, unsafe_allow_html=True)
-        else:
-            with st.container():
-                st.markdown(f"""
-                <div class="chat-message assistant">
-                    <div class="chat-avatar">🤖</div>
-                    <div class="chat-content">{message.content}</div>
-                </div>
-                """, unsafe_allow_html=True)
-
-# Text input using a form with premium styling
-with st.form(key="input_form", clear_on_submit=True):
-    st.text_input(
-        "Type your question about products here:",
-        key="user_input",
-        placeholder="e.g., 'Find me running shoes under $150' or 'What kitchen products do you have?'"
-    )
-    
-    col1, col2 = st.columns([4, 1])
-    with col2:
-        submit_button = st.form_submit_button("Send 📤", on_click=handle_chat_input)
+    earlier_messages = st.session_state.chat_history[:-CHAT_PAGE_SIZE]
+    if earlier_messages:
+        with st.expander(f"Earlier messages ({len(earlier_messages)})"):
+            render_chat_messages(earlier_messages)
+    render_chat_messages(st.session_state.chat_history[-CHAT_PAGE_SIZE:])
+
+# Chat input, pinned to the bottom of the page
+st.chat_input(
+    "e.g., 'Find me running shoes under $150' or 'What kitchen products do you have?'",
+    key="user_input",
+    on_submit=handle_chat_input
+)
 
 # Action buttons
 action_col1, action_col2 = st.columns(2)
@@ -790,18 +510,11 @@ with action_col2:
         )
 
 # Quick category buttons
-if len(st.session_state.chat_history) > 1:  # Only show after conversation has started
+if conversation_started:
     st.markdown("---")
     st.markdown("### Popular Categories")
-    categories, _ = load_product_categories()
-    
-    # Define handler function *before* the loop
-    def handle_quick_category_click(category_name):
-        query = f"Show me products in the {category_name} category"
-        run_agent_query(query)
-        
     if categories:
-        top_categories = sorted(categories)[:8] if len(categories) > 8 else sorted(categories)
+        top_categories = catalog.top_categories
         button_cols = st.columns(4)
         for i, category in enumerate(top_categories):
             col_idx = i % 4
@@ -810,7 +523,7 @@ if len(st.session_state.chat_history) > 1:  # Only show after conversation has s
             with button_cols[col_idx]:
                  st.button(f"{icon} {category}", 
                            key=f"quick_btn_{category}_{i}", 
-                           on_click=handle_quick_category_click, 
+                           on_click=handle_category_click, 
                            args=(category,), 
                            use_container_width=True)
 
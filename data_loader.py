@@ -1,8 +1,64 @@
+import os
+from itertools import chain
+from hashlib import blake2b
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
 import pandas as pd
+import torch
 from sentence_transformers import SentenceTransformer
 import chromadb
-from typing import Optional
+from tqdm import tqdm
+from typing import Dict, Iterator, List, Optional, Tuple, Union
 import utils
+import embedding_backend
+
+EMBEDDING_MODEL_NAME = 'all-MiniLM-L6-v2'
+
+# Number of texts the embedding model encodes per forward pass; a GPU takes larger batches
+EMBEDDING_BATCH_SIZE = 64
+GPU_EMBEDDING_BATCH_SIZE = 128
+
+# Catalogs with at least this many rows are prepared for embedding in worker processes
+PARALLEL_PREP_MIN_ROWS = 50000
+
+# Rows read, embedded and stored at a time, so memory use does not grow with the catalog
+# (large enough for a full chunk to be prepared in worker processes)
+CSV_CHUNK_SIZE = 50000
+
+def get_embedding_device() -> str:
+    """
+    Pick the device for the embedding model: SHOPSIGHT_DEVICE if set, otherwise CUDA when available
+    
+    Returns:
+        str: Torch device name, e.g. 'cuda', 'cuda:1' or 'cpu'
+    """
+    device = os.getenv("SHOPSIGHT_DEVICE")
+    if device:
+        return device
+    return 'cuda' if torch.cuda.is_available() else 'cpu'
+
+def load_embedding_model() -> Union[SentenceTransformer, embedding_backend.ORTEmbedder]:
+    """
+    Load the embedding model for the selected device
+    
+    On the CPU the int8 ONNX Runtime model is used when it has been exported
+    (python embedding_backend.py); otherwise the sentence transformer is loaded,
+    in half precision on CUDA.
+    
+    Returns:
+        Embedding model with a SentenceTransformer-compatible encode method
+    """
+    device = get_embedding_device()
+    if device == 'cpu' and embedding_backend.onnx_model_available():
+        print(f"Loading quantized ONNX embedding model from {utils.ONNX_MODEL_DIRECTORY}...")
+        return embedding_backend.ORTEmbedder()
+    
+    print(f"Loading embedding model {EMBEDDING_MODEL_NAME} on {device}...")
+    model = SentenceTransformer(EMBEDDING_MODEL_NAME, device=device)
+    if _on_gpu(model):
+        # fp16 matmuls run on the tensor cores
+        model.half()
+    return model
 
 def load_products_from_csv(filepath: str) -> pd.DataFrame:
     """
@@ -25,6 +81,239 @@ def load_products_from_csv(filepath: str) -> pd.DataFrame:
         print(f"Error: File {filepath} not found")
         raise
 
+def _pin_dtypes(chunk: pd.DataFrame, dtypes: pd.Series) -> pd.DataFrame:
+    """
+    Cast the columns of a CSV chunk to the dtypes inferred for an earlier chunk
+    
+    Values are never changed: an integer column with blanks in this chunk keeps its
+    numbers as ints (blanks as NaN), and a column that cannot be cast without loss is
+    left as read.
+    
+    Args:
+        chunk (pd.DataFrame): Chunk as parsed by pandas
+        dtypes (pd.Series): Column dtypes to pin, by column name
+        
+    Returns:
+        pd.DataFrame: The chunk with its columns cast
+    """
+    pinned = {}
+    for col, dtype in dtypes.items():
+        if col not in chunk.columns or chunk[col].dtype == dtype:
+            continue
+        values = chunk[col]
+        if pd.api.types.is_integer_dtype(dtype):
+            present = values.dropna()
+            if not pd.api.types.is_numeric_dtype(values) or not (present % 1 == 0).all():
+                continue
+            if len(present) < len(values):
+                pinned[col] = values.astype('Int64').astype(object).where(values.notna(), np.nan)
+            else:
+                pinned[col] = values.astype(dtype)
+        else:
+            try:
+                pinned[col] = values.astype(dtype)
+            except (TypeError, ValueError):
+                continue
+    return chunk.assign(**pinned) if pinned else chunk
+
+def read_products_in_chunks(filepath: str, chunksize: int = CSV_CHUNK_SIZE) -> Iterator[pd.DataFrame]:
+    """
+    Stream product data from a CSV file in chunks of rows
+    
+    Args:
+        filepath (str): Path to the CSV file
+        chunksize (int): Rows per chunk
+        
+    Returns:
+        Iterator[pd.DataFrame]: The chunks of product data, in file order
+        
+    Raises:
+        FileNotFoundError: If the CSV file is not found (raised here, not on the first chunk)
+    """
+    try:
+        reader = pd.read_csv(filepath, chunksize=chunksize)
+    except FileNotFoundError:
+        print(f"Error: File {filepath} not found")
+        raise
+    
+    def chunks() -> Iterator[pd.DataFrame]:
+        total = 0
+        dtypes = None
+        with reader:
+            for chunk in reader:
+                # Every chunk keeps the dtypes of the first one, so a product's text
+                # and metadata do not depend on which chunk it landed in
+                if dtypes is None:
+                    dtypes = chunk.dtypes
+                else:
+                    chunk = _pin_dtypes(chunk, dtypes)
+                total += len(chunk)
+                yield chunk
+        print(f"Successfully loaded {total} products from {filepath}")
+    
+    return chunks()
+
+def _on_gpu(model) -> bool:
+    return getattr(model.device, 'type', None) == 'cuda'
+
+def encode_texts(model, texts: List[str]) -> np.ndarray:
+    """
+    Embed texts in batches, grouping texts of similar length together
+    
+    Each batch is padded to its longest text, so encoding in length order keeps
+    padding (and wasted compute) to a minimum. Repeated texts (e.g. variants that
+    share their copy) are encoded once.
+    
+    Args:
+        model: Embedding model from load_embedding_model
+        texts (List[str]): Texts to embed
+        
+    Returns:
+        np.ndarray: One embedding row per text, in the order of texts
+    """
+    if not texts:
+        return np.empty((0, 0), dtype=np.float32)
+    
+    # Encode the first occurrence of each distinct text; inverse maps every text to its row
+    keys = np.array([blake2b(text.encode(), digest_size=16).digest() for text in texts])
+    _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    unique_texts = [texts[i] for i in first]
+    
+    order = np.argsort([len(text) for text in unique_texts], kind='stable')
+    sorted_embeddings = model.encode(
+        [unique_texts[i] for i in order],
+        batch_size=GPU_EMBEDDING_BATCH_SIZE if _on_gpu(model) else EMBEDDING_BATCH_SIZE,
+        show_progress_bar=True,
+        convert_to_numpy=True
+    )
+    # Put the rows back in the original order (as float32, also when the model ran in fp16)
+    sorted_embeddings = sorted_embeddings.astype(np.float32, copy=False)
+    unique_embeddings = np.empty_like(sorted_embeddings)
+    unique_embeddings[order] = sorted_embeddings
+    return unique_embeddings[inverse.reshape(-1)]
+
+# Columns that make up the base of each product's embedding text
+REQUIRED_COLUMNS = ['product_id', 'name', 'description', 'price']
+
+def valid_product_rows(df: pd.DataFrame) -> pd.Series:
+    """
+    Mark the rows that have both a product_id and a name
+    
+    Args:
+        df (pd.DataFrame): Products
+        
+    Returns:
+        pd.Series: Boolean mask aligned with df
+    """
+    valid = pd.Series(True, index=df.index)
+    for col in ['product_id', 'name']:
+        if col not in df.columns:
+            return pd.Series(False, index=df.index)
+        # Compare the values as they are instead of formatting every one as a string
+        values = df[col].to_numpy(dtype=object)
+        valid &= df[col].notna().to_numpy() & (values != '')
+    return valid
+
+def build_embedding_texts(df: pd.DataFrame) -> pd.Series:
+    """
+    Build the text embedded for each product with whole-column string operations
+    
+    The text is "Name: ... Description: ... Price: $...", followed by
+    " column: value" for every other column with a value in that row.
+    
+    Args:
+        df (pd.DataFrame): Valid products (see valid_product_rows)
+        
+    Returns:
+        pd.Series: Embedding text per row, aligned with df
+    """
+    def column_text(col: str, default: str) -> pd.Series:
+        if col not in df.columns:
+            return pd.Series(default, index=df.index, dtype=object)
+        return df[col].astype(object).fillna(default).astype(str)
+    
+    price = df['price'].astype(float).astype(str) if 'price' in df.columns else pd.Series('0.0', index=df.index, dtype=object)
+    texts = ("Name: " + column_text('name', '') +
+             " Description: " + column_text('description', '') +
+             " Price: $" + price)
+    
+    # Add other specifications if available
+    for col in df.columns:
+        if col not in REQUIRED_COLUMNS:
+            texts = texts.where(df[col].isna(), texts + f" {col}: " + df[col].astype(str))
+    return texts
+
+def _build_records(df: pd.DataFrame) -> Tuple[List[str], List[str], List[Dict]]:
+    """
+    Build the ChromaDB ids, documents and metadatas for valid products
+    
+    Args:
+        df (pd.DataFrame): Valid products (see valid_product_rows)
+        
+    Returns:
+        Tuple[List[str], List[str], List[Dict]]: ids, embedding texts and metadatas, one per row
+    """
+    product_ids = df['product_id'] if 'product_id' in df.columns else pd.Series(dtype=object)
+    # A CSV with a missing product_id parses the column as float; write whole
+    # numbers without the ".0" so ids match the catalog
+    if pd.api.types.is_float_dtype(product_ids) and (product_ids % 1 == 0).all():
+        product_ids = product_ids.astype(np.int64)
+    ids = product_ids.astype(str).tolist() if not df.empty else []
+    documents = build_embedding_texts(df).tolist()
+    
+    # Ensure price is float, converting the whole column at once
+    if 'price' in df.columns:
+        df = df.assign(price=df['price'].astype(np.float64))
+    
+    # One metadata dict per row, converted in a single pass over the columns
+    metadatas = df.to_dict(orient='records')
+    return ids, documents, metadatas
+
+def start_prep_pool() -> Optional[ProcessPoolExecutor]:
+    """
+    Start the worker processes that prepare_records splits large catalogs across
+    
+    Call this before the embedding model is loaded and before any other thread is
+    started, so the workers are not forked from a process holding the model, a CUDA
+    context or running threads.
+    
+    Returns:
+        Optional[ProcessPoolExecutor]: The started pool, or None on a single CPU
+    """
+    workers = os.cpu_count() or 1
+    if workers < 2:
+        return None
+    pool = ProcessPoolExecutor(max_workers=workers)
+    # The first task starts the worker processes (all of them, with the fork start method)
+    pool.submit(int).result()
+    return pool
+
+def prepare_records(df: pd.DataFrame, pool: Optional[ProcessPoolExecutor] = None) -> Tuple[List[str], List[str], List[Dict]]:
+    """
+    Build the ChromaDB records for valid products, splitting large catalogs
+    across the worker processes of the pool
+    
+    Args:
+        df (pd.DataFrame): Valid products (see valid_product_rows)
+        pool (Optional[ProcessPoolExecutor]): Pool from start_prep_pool; without one the records are built in-process
+        
+    Returns:
+        Tuple[List[str], List[str], List[Dict]]: ids, embedding texts and metadatas, in row order
+    """
+    if pool is None or len(df) < PARALLEL_PREP_MIN_ROWS:
+        return _build_records(df)
+    
+    workers = os.cpu_count() or 1
+    chunk_size = -(-len(df) // workers)
+    chunks = [df.iloc[start:start + chunk_size] for start in range(0, len(df), chunk_size)]
+    ids, documents, metadatas = [], [], []
+    # map yields the results in chunk order, so the records keep the CSV order
+    for chunk_ids, chunk_documents, chunk_metadatas in pool.map(_build_records, chunks):
+        ids.extend(chunk_ids)
+        documents.extend(chunk_documents)
+        metadatas.extend(chunk_metadatas)
+    return ids, documents, metadatas
+
 def create_or_get_chroma_collection(persist_directory: str, collection_name: str) -> chromadb.Collection:
     """
     Initialize ChromaDB client and get or create a collection
@@ -40,6 +329,29 @@ def create_or_get_chroma_collection(persist_directory: str, collection_name: str
     collection = client.get_or_create_collection(name=collection_name)
     return collection
 
+def upsert_in_batches(collection: chromadb.Collection, ids: List[str], embeddings: np.ndarray, metadatas: List[Dict], documents: List[str]) -> None:
+    """
+    Upsert products into a ChromaDB collection in batches of CHROMA_BATCH_SIZE
+    
+    Very large single calls can time out or build huge intermediates.
+    
+    Args:
+        collection (chromadb.Collection): Collection to write to
+        ids (List[str]): Product ids
+        embeddings (np.ndarray): One float32 embedding row per product
+        metadatas (List[Dict]): Product metadata
+        documents (List[str]): Embedded texts
+    """
+    batch_size = utils.CHROMA_BATCH_SIZE
+    for start in tqdm(range(0, len(ids), batch_size), desc="Upserting", unit="batch"):
+        end = start + batch_size
+        collection.upsert(
+            ids=ids[start:end],
+            embeddings=embeddings[start:end],
+            metadatas=metadatas[start:end],
+            documents=documents[start:end]
+        )
+
 def load_and_vectorize_data(csv_filepath: str, persist_directory: str, collection_name: str) -> None:
     """
     Load product data from CSV, generate embeddings, and store in ChromaDB
@@ -49,78 +361,74 @@ def load_and_vectorize_data(csv_filepath: str, persist_directory: str, collectio
         persist_directory (str): Directory to persist ChromaDB data
         collection_name (str): Name of the collection
     """
-    # Load products from CSV
-    df = load_products_from_csv(csv_filepath)
-    
-    # Initialize the sentence transformer model
-    print("Initializing Sentence Transformer model...")
-    model = SentenceTransformer('all-MiniLM-L6-v2')
-    
-    # Get or create ChromaDB collection
-    print(f"Creating or getting ChromaDB collection '{collection_name}'...")
-    collection = create_or_get_chroma_collection(persist_directory, collection_name)
-    
-    # Prepare data for ChromaDB
-    ids = []
-    embeddings = []
-    metadatas = []
-    documents = []
-    
-    # Required columns for processing
-    required_columns = ['product_id', 'name', 'description', 'price']
-    missing_columns = [col for col in required_columns if col not in df.columns]
-    
-    if missing_columns:
-        print(f"Warning: Missing required columns: {missing_columns}")
-        print("Continuing with available columns...")
-    
-    # Process each product
-    print(f"Processing {len(df)} products...")
-    for _, row in df.iterrows():
-        # Handle potential missing data
-        product_id = str(row.get('product_id', ''))
-        name = str(row.get('name', ''))
-        description = str(row.get('description', ''))
-        price = float(row.get('price', 0.0))
-        
-        # Skip rows with missing critical information
-        if not product_id or not name:
-            print(f"Skipping row with insufficient data: {row.to_dict()}")
-            continue
-        
-        # Construct text for embedding
-        text_for_embedding = f"Name: {name} Description: {description} Price: ${price}"
-        
-        # Add other specifications if available
-        for col in row.index:
-            if col not in ['product_id', 'name', 'description', 'price'] and not pd.isna(row[col]):
-                text_for_embedding += f" {col}: {row[col]}"
-        
-        # Generate embedding
-        embedding = model.encode(text_for_embedding)
+    # Open the CSV for streaming: each chunk is embedded and stored before the next one is read
+    chunks = read_products_in_chunks(csv_filepath)
+    
+    # A full first chunk means the catalog is large enough for worker processes; they
+    # are started now, before the model is loaded, and reused for every chunk
+    first_chunk = next(chunks, None)
+    if first_chunk is not None:
+        chunks = chain([first_chunk], chunks)
+    prep_pool = start_prep_pool() if first_chunk is not None and len(first_chunk) >= PARALLEL_PREP_MIN_ROWS else None
+    
+    try:
+        # Initialize the sentence transformer model
+        print("Initializing Sentence Transformer model...")
+        model = load_embedding_model()
         
-        # Prepare metadata (convert row to dict, ensuring appropriate types)
-        metadata = row.to_dict()
-        # Ensure price is float
-        if 'price' in metadata:
-            metadata['price'] = float(metadata['price'])
+        # Get or create ChromaDB collection
+        print(f"Creating or getting ChromaDB collection '{collection_name}'...")
+        collection = create_or_get_chroma_collection(persist_directory, collection_name)
         
-        # Add to lists
-        ids.append(product_id)
-        embeddings.append(embedding.tolist())
-        metadatas.append(metadata)
-        documents.append(text_for_embedding)
-    
-    # Add data to ChromaDB collection (upsert for idempotency)
-    if ids:
-        print(f"Adding {len(ids)} products to ChromaDB collection...")
-        collection.upsert(
-            ids=ids,
-            embeddings=embeddings,
-            metadatas=metadatas,
-            documents=documents
-        )
-        print("Successfully added products to ChromaDB collection")
+        added = 0
+        skipped = 0
+        # A chunk is written on a background thread while the next one is read and
+        # embedded; at most one write is in flight, so memory use stays bounded
+        with ThreadPoolExecutor(max_workers=1) as writer:
+            pending_write = None
+            for chunk_number, df in enumerate(chunks):
+                if chunk_number == 0:
+                    # Required columns for processing
+                    missing_columns = [col for col in REQUIRED_COLUMNS if col not in df.columns]
+                    
+                    if missing_columns:
+                        print(f"Warning: Missing required columns: {missing_columns}")
+                        print("Continuing with available columns...")
+                
+                # Skip rows with missing critical information
+                print(f"Processing {len(df)} products...")
+                valid = valid_product_rows(df)
+                skipped += int((~valid).sum())
+                df_valid = df[valid]
+                
+                # Prepare data for ChromaDB
+                ids, documents, metadatas = prepare_records(df_valid, prep_pool)
+                if not ids:
+                    continue
+                
+                # Embed all texts in batched forward passes instead of one product at a time
+                print(f"Generating embeddings for {len(documents)} products...")
+                # Kept as a float32 array: Chroma takes numpy embeddings without nested Python lists
+                embeddings = encode_texts(model, documents)
+                
+                # Add data to ChromaDB collection (upsert for idempotency)
+                if pending_write is not None:
+                    pending_write.result()
+                print(f"Adding {len(ids)} products to ChromaDB collection...")
+                pending_write = writer.submit(upsert_in_batches, collection, ids, embeddings, metadatas, documents)
+                added += len(ids)
+            
+            # Wait for the last write (re-raising any error it hit)
+            if pending_write is not None:
+                pending_write.result()
+    finally:
+        if prep_pool is not None:
+            prep_pool.shutdown()
+    
+    if skipped:
+        print(f"Skipped {skipped} rows with insufficient data (missing product_id or name)")
+    if added:
+        print(f"Successfully added {added} products to ChromaDB collection")
     else:
         print("No valid products found to add to ChromaDB")
 
@@ -0,0 +1,121 @@
+import os
+import sys
+import numpy as np
+from typing import List
+import utils
+
+# onnxruntime is optional: without it (or without the exported model) data_loader
+# embeds with the PyTorch SentenceTransformer instead
+try:
+    import onnxruntime as ort
+    from transformers import AutoTokenizer
+except ImportError:
+    ort = None
+    AutoTokenizer = None
+
+ONNX_SOURCE_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+ONNX_MODEL_FILE = "model_quantized.onnx"
+# Longest input the model sees, matching the SentenceTransformer configuration
+MAX_SEQ_LENGTH = 256
+
+def onnx_model_available(model_dir: str = utils.ONNX_MODEL_DIRECTORY) -> bool:
+    """
+    Check whether the quantized ONNX model can be used
+    
+    Args:
+        model_dir (str): Directory the model was exported to
+    
+    Returns:
+        bool: True if onnxruntime is installed and the exported model exists
+    """
+    return ort is not None and os.path.exists(os.path.join(model_dir, ONNX_MODEL_FILE))
+
+class ORTEmbedder:
+    """
+    int8-quantized all-MiniLM-L6-v2 served through ONNX Runtime on the CPU
+    
+    encode mirrors SentenceTransformer.encode (mean pooling over the tokens, then
+    L2 normalization), so the embeddings can be used interchangeably.
+    """
+    
+    device = None
+    
+    def __init__(self, model_dir: str = utils.ONNX_MODEL_DIRECTORY):
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = os.cpu_count()
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, ONNX_MODEL_FILE),
+            options,
+            providers=['CPUExecutionProvider']
+        )
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.input_names = [model_input.name for model_input in self.session.get_inputs()]
+    
+    def encode(self, texts: List[str], batch_size: int = 64, show_progress_bar: bool = False, convert_to_numpy: bool = True) -> np.ndarray:
+        """
+        Embed texts in batches
+        
+        Args:
+            texts (List[str]): Texts to embed
+            batch_size (int): Number of texts per forward pass
+            show_progress_bar (bool): Print progress after each batch
+            convert_to_numpy (bool): Accepted for compatibility; the result is always a numpy array
+        
+        Returns:
+            np.ndarray: float32 array with one normalized embedding row per text
+        """
+        batches = []
+        for start in range(0, len(texts), batch_size):
+            tokens = self.tokenizer(
+                texts[start:start + batch_size],
+                padding=True,
+                truncation=True,
+                max_length=MAX_SEQ_LENGTH,
+                return_tensors='np'
+            )
+            inputs = {}
+            for name in self.input_names:
+                if name in tokens:
+                    inputs[name] = tokens[name].astype(np.int64)
+                else:
+                    inputs[name] = np.zeros_like(tokens['input_ids'], dtype=np.int64)
+            token_embeddings = self.session.run(None, inputs)[0]
+            
+            # Mean pooling over the real (non-padding) tokens, then L2 normalization
+            mask = tokens['attention_mask'][..., np.newaxis].astype(np.float32)
+            pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            batches.append(pooled.astype(np.float32))
+            
+            if show_progress_bar:
+                print(f"Encoded {min(start + batch_size, len(texts))}/{len(texts)} texts")
+        
+        if not batches:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.vstack(batches)
+
+def export_quantized_model(output_dir: str = utils.ONNX_MODEL_DIRECTORY) -> None:
+    """
+    Export all-MiniLM-L6-v2 to ONNX and quantize its weights to int8 (needs optimum[onnxruntime])
+    
+    Args:
+        output_dir (str): Directory to write the quantized model and tokenizer to
+    """
+    from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    from transformers import AutoTokenizer
+    
+    print(f"Exporting {ONNX_SOURCE_MODEL} to ONNX...")
+    model = ORTModelForFeatureExtraction.from_pretrained(ONNX_SOURCE_MODEL, export=True)
+    
+    # Dynamic quantization: int8 weights, activations quantized at run time
+    print(f"Quantizing to {output_dir}...")
+    quantizer = ORTQuantizer.from_pretrained(model)
+    quantization_config = AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=True)
+    quantizer.quantize(save_dir=output_dir, quantization_config=quantization_config)
+    AutoTokenizer.from_pretrained(ONNX_SOURCE_MODEL).save_pretrained(output_dir)
+
+if __name__ == "__main__":
+    output_dir = sys.argv[1] if len(sys.argv) > 1 else utils.ONNX_MODEL_DIRECTORY
+    export_quantized_model(output_dir)
+    print("ONNX model export completed")
@@ -5,23 +5,29 @@ ShopSight AI - Launch script
 This script launches the ShopSight AI shopping assistant application.
 """
 
+import importlib.util
 import os
-import subprocess
 import sys
 
+# Modules the application imports, checked for presence without importing them
+REQUIRED_MODULES = ["streamlit", "langchain", "google.generativeai", "sentence_transformers", "chromadb"]
+
 def check_requirements():
     """Check if all required packages are installed"""
-    try:
-        import streamlit
-        import langchain
-        import google.generativeai
-        import sentence_transformers
-        import chromadb
-        return True
-    except ImportError as e:
-        print(f"Error: Missing dependency - {e}")
+    missing = []
+    for module in REQUIRED_MODULES:
+        try:
+            if importlib.util.find_spec(module) is None:
+                missing.append(module)
+        except ModuleNotFoundError:
+            # The parent package of a dotted name (e.g. google) is missing
+            missing.append(module)
+    
+    if missing:
+        print(f"Error: Missing dependencies - {', '.join(missing)}")
         print("Please install all required packages using: pip install -r requirements.txt")
         return False
+    return True
 
 def check_env():
     """Check if .env file exists with API key"""
@@ -30,11 +36,12 @@ def check_env():
         print("Please create a .env file with your GOOGLE_API_KEY")
         return False
     
-    with open(".env", "r") as f:
-        if "GOOGLE_API_KEY" not in f.read():
-            print("Error: GOOGLE_API_KEY not found in .env file")
-            print("Please add your Gemini API key to the .env file as GOOGLE_API_KEY=your_key_here")
-            return False
+    # Parse the file so comments and other variable names do not count as the key
+    from dotenv import dotenv_values
+    if not dotenv_values(".env").get("GOOGLE_API_KEY"):
+        print("Error: GOOGLE_API_KEY not found in .env file")
+        print("Please add your Gemini API key to the .env file as GOOGLE_API_KEY=your_key_here")
+        return False
     
     return True
 
@@ -73,7 +80,11 @@ def main():
     print("Access the application at: http://localhost:8501")
     
     try:
-        subprocess.run(["streamlit", "run", "app.py"])
+        # Run the Streamlit server in this interpreter instead of starting a
+        # separate `streamlit run` process that imports everything again
+        from streamlit.web import bootstrap
+        bootstrap.load_config_options(flag_options={})
+        bootstrap.run("app.py", "", [], flag_options={})
     except KeyboardInterrupt:
         print("\n🛑 ShopSight AI Application stopped")
     except Exception as e:
@@ -0,0 +1,32 @@
+import re
+import unittest
+
+import utils
+
+# A "$" not preceded by a backslash; two of these in one reply render as LaTeX
+UNESCAPED_DOLLAR = re.compile(r"(?<!\\)\$")
+
+class MarkdownListTest(unittest.TestCase):
+    def test_one_bullet_per_product(self):
+        lines = [
+            "ID: 3, Name: Trail Shoe, Price: $45.50, Rating: 4.5/5",
+            "ID: 5, Name: Desk Lamp, Price: $79.00",
+        ]
+        rendered = utils.markdown_list(lines)
+        
+        rendered_lines = rendered.split("\n")
+        self.assertEqual(len(rendered_lines), len(lines))
+        for line in rendered_lines:
+            self.assertTrue(line.startswith("- "))
+    
+    def test_dollar_signs_are_escaped(self):
+        rendered = utils.markdown_list(["Price: $45.50", "Price: $79.00"])
+        
+        self.assertIsNone(UNESCAPED_DOLLAR.search(rendered))
+        self.assertIn("\\$45.50", rendered)
+    
+    def test_empty_list(self):
+        self.assertEqual(utils.markdown_list([]), "")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,15 +1,95 @@
 import os
+import re
 import json
+import threading
+import numpy as np
 import pandas as pd
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, Callable, List, NamedTuple, Optional, Set
+from collections import defaultdict
+from functools import lru_cache, partial
 from dotenv import load_dotenv
 import csv
 
+# pyarrow is optional: it enables the on-disk products cache next to the CSV
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:
+    pa = None
+    feather = None
+
 # Constants for file paths and configurations
 CSV_FILEPATH = "data/products.csv"
+PRODUCTS_CACHE_FILEPATH = "data/products.feather"
 API_KEYS_FILE = "config/api_keys.json"
 PERSIST_DIRECTORY = "data/chroma_db"
 CHROMA_COLLECTION_NAME = "products"
+# Products per ChromaDB upsert call when building the vector database
+CHROMA_BATCH_SIZE = 250
+ONNX_MODEL_DIRECTORY = "models/all-MiniLM-L6-v2-onnx-int8"
+
+# Incremented whenever load_products_data picks up a new or changed CSV.
+# Callers that memoize results derived from the catalog include it in their cache keys.
+PRODUCTS_VERSION = 0
+# Schema metadata key recording which CSV (mtime, size) the feather cache was built from
+_CACHE_SIGNATURE_KEY = b"shopsight_csv_signature"
+# Bump whenever the CSV cleaning changes so caches written by older code are rebuilt
+_CACHE_FORMAT_VERSION = 2
+# Inverted index over product names and descriptions: token -> row positions
+_TOKEN_PATTERN = re.compile(r"\w+")
+# Queries containing these are matched as regular expressions and bypass the index
+_REGEX_METACHARACTERS = re.compile(r"[.^$*+?{}\[\]\\|()]")
+
+# Lower-cased string forms of in_stock values that mean "in stock"; anything else,
+# including missing values, is treated as out of stock
+_IN_STOCK_TRUE_VALUES = ('true', 'yes', 'y', '1', '1.0')
+
+# Code that matches no row (categorical codes are >= 0, and -1 marks a missing value)
+_NO_CODE = -2
+
+# Token postings remembered per catalog version
+_TOKEN_POSTINGS_CACHE_SIZE = 1024
+
+# Columns of the empty DataFrame handed out when the products cannot be loaded
+_EMPTY_PRODUCTS_COLUMNS = ['id', 'name', 'price', 'category', 'description', 'brand', 'rating']
+
+class _Catalog(NamedTuple):
+    """
+    One loaded version of the products with every lookup derived from it
+    
+    A reload builds a complete new snapshot and publishes it with a single assignment,
+    so a reader that takes the snapshot once sees one consistent version throughout.
+    """
+    version: int
+    # (mtime_ns, size) of the CSV file the products came from
+    signature: tuple
+    # Normalized products, indexed by id
+    df: pd.DataFrame
+    # Products per category, sorted by category name
+    category_counts: Dict[str, int]
+    # Unique categories in order of first appearance
+    categories: List[str]
+    # Inverted index over product names and descriptions: token -> row positions
+    token_index: Dict[str, Set[int]]
+    # Rows whose indexed words contain a token (memoized token_index lookups)
+    token_postings: Callable[[str], frozenset]
+    # Product fields keyed by id, for constant-time lookups (missing values are left out)
+    products_by_id: Dict[int, Dict[str, Any]]
+    product_columns: List[str]
+    # Filter columns as numpy arrays (category and brand as the codes of their lower-cased labels)
+    filter_arrays: Dict[str, np.ndarray]
+    # Lower-cased category/brand label -> its code in filter_arrays
+    label_codes: Dict[str, Dict[str, int]]
+    # Lower-cased name and description columns, so text searches skip lower-casing per query
+    text_lower: Dict[str, pd.Series]
+    # Row positions ordered by price, and the prices in that order, for range lookups
+    price_order: np.ndarray
+    sorted_prices: np.ndarray
+
+# The published catalog snapshot (None until the first successful load)
+_catalog: Optional[_Catalog] = None
+# Serializes reloads: one thread parses a changed CSV while the others wait for it
+_load_lock = threading.Lock()
 
 def load_api_keys() -> Dict[str, str]:
     """
@@ -26,54 +106,363 @@ def load_api_keys() -> Dict[str, str]:
     except json.JSONDecodeError:
         raise ValueError(f"Invalid JSON in {API_KEYS_FILE}. Please check the file format.")
 
-def load_products_data() -> pd.DataFrame:
+def _normalize_products(df: pd.DataFrame) -> pd.DataFrame:
     """
-    Load product data from CSV file
+    Convert a freshly parsed products DataFrame into its shared, query-ready form
+    
+    Args:
+        df: Products DataFrame with an 'id' column
+        
+    Returns:
+        pd.DataFrame: DataFrame indexed by product id with categorical category/brand columns
+    """
+    # Ids become float when the column had gaps; restore integer ids for lookups
+    if pd.api.types.is_float_dtype(df['id']):
+        df['id'] = df['id'].astype('int64')
+    
+    # Low-cardinality string columns filter much faster as categoricals
+    for column in ('category', 'brand'):
+        if column in df.columns:
+            df[column] = df[column].astype('category')
+    
+    # Keep 'id' as a column too; the index is left unnamed so sorting by 'id' stays unambiguous
+    return df.set_index('id', drop=False).rename_axis(None)
+
+def _build_token_index(df: pd.DataFrame) -> Dict[str, Set[int]]:
+    """
+    Map every lower-cased word in the name and description columns to the rows containing it
+    
+    Args:
+        df: Normalized products DataFrame
+        
+    Returns:
+        Dict[str, Set[int]]: Token to set of row positions
+    """
+    text = df['name'].fillna('').astype(str)
+    if 'description' in df.columns:
+        text = text + ' ' + df['description'].fillna('').astype(str)
+    
+    index = defaultdict(set)
+    for position, row_text in enumerate(text.str.lower()):
+        for token in set(_TOKEN_PATTERN.findall(row_text)):
+            index[token].add(position)
+    return dict(index)
+
+def _token_postings(token_index: Dict[str, Set[int]], token: str) -> frozenset:
+    """Rows containing the token, either as a whole word or inside a longer one"""
+    return frozenset().union(*(rows for indexed, rows in token_index.items() if token in indexed))
+
+def text_search(query: str, catalog: Optional[_Catalog] = None) -> Optional[np.ndarray]:
+    """
+    Find candidate rows for a text query using the in-memory token index
+    
+    Every word of the query must appear in the row's name or description, whole or
+    as part of a longer word, so the candidates are a superset of the rows whose
+    name or description contains the full query string.
+    
+    Args:
+        query: Search query string
+        catalog: Catalog snapshot to search (default: the current one)
+        
+    Returns:
+        Sorted row positions into the snapshot's products DataFrame, or None if the
+        query has no word characters to look up
+    """
+    tokens = set(_TOKEN_PATTERN.findall(query.lower()))
+    if not tokens:
+        return None
+    
+    if catalog is None:
+        catalog = _load_catalog()
+        if catalog is None:
+            return np.empty(0, dtype=np.int64)
+    
+    candidates = None
+    # Longer tokens tend to be more selective, so intersect them first
+    for token in sorted(tokens, key=len, reverse=True):
+        postings = catalog.token_postings(token)
+        candidates = postings if candidates is None else candidates & postings
+        if not candidates:
+            break
+    
+    return np.array(sorted(candidates), dtype=np.int64)
+
+def _price_range_positions(catalog: _Catalog, min_price: Optional[float], max_price: Optional[float]) -> np.ndarray:
+    """
+    Find rows priced within [min_price, max_price] by binary search on the presorted prices
+    
+    Args:
+        catalog: Catalog snapshot to search
+        min_price: Lower bound (optional)
+        max_price: Upper bound (optional)
+        
+    Returns:
+        np.ndarray: Matching row positions in ascending (original row) order
+    """
+    lo = np.searchsorted(catalog.sorted_prices, min_price if min_price is not None else -np.inf, side='left')
+    hi = np.searchsorted(catalog.sorted_prices, max_price if max_price is not None else np.inf, side='right')
+    return np.sort(catalog.price_order[lo:hi])
+
+# Column and direction used by each sort option: (column, descending)
+_SORT_COLUMNS = {
+    "price_low": ('price', False),
+    "price_high": ('price', True),
+    "rating": ('rating', True),
+    "newest": ('id', True),
+}
+
+def _top_k_rows(df: pd.DataFrame, sort_by: str, top_k: int) -> pd.DataFrame:
+    """
+    Select the first top_k rows of the requested sort order without sorting the whole frame
+    
+    Args:
+        df: Filtered products DataFrame
+        sort_by: Sorting criteria (see search_products)
+        top_k: Number of rows to keep
+        
+    Returns:
+        pd.DataFrame: Up to top_k rows in sorted order
+    """
+    if sort_by not in _SORT_COLUMNS or _SORT_COLUMNS[sort_by][0] not in df.columns:
+        return df.head(top_k)
+    
+    column, descending = _SORT_COLUMNS[sort_by]
+    selected = df.nlargest(top_k, column) if descending else df.nsmallest(top_k, column)
+    
+    # Missing values go last, as with a full sort (pandas versions differ in whether
+    # nlargest/nsmallest include them at all)
+    selected = selected[selected[column].notna()]
+    if len(selected) < top_k:
+        missing = df[df[column].isna()]
+        selected = pd.concat([selected, missing.head(top_k - len(selected))])
+    return selected
+
+@lru_cache(maxsize=128)
+def _query_pattern(query_lower: str) -> re.Pattern:
+    """Compile a regex query once; repeated searches reuse the compiled pattern"""
+    return re.compile(query_lower)
+
+def _contains(series: pd.Series, query_lower: str) -> pd.Series:
+    """
+    Test which values contain the query, scanning plain text literally and
+    matching queries with regex metacharacters as (cached) compiled patterns
+    
+    Args:
+        series: Lower-cased string column
+        query_lower: Lower-cased query
+        
+    Returns:
+        pd.Series: Boolean mask aligned with the series
+    """
+    if _REGEX_METACHARACTERS.search(query_lower):
+        # Arrow-backed strings compile the pattern in C++ and take it as a string
+        if series.dtype != object:
+            return series.str.contains(query_lower, regex=True, na=False)
+        return series.str.contains(_query_pattern(query_lower), na=False)
+    return series.str.contains(query_lower, regex=False, na=False)
+
+def _read_products_cache(signature: tuple) -> Optional[pd.DataFrame]:
+    """
+    Read the cleaned products from the feather cache if it was built from the current CSV
+    
+    Args:
+        signature: (mtime_ns, size) of the CSV file
+        
+    Returns:
+        Optional[pd.DataFrame]: Cached products, or None if the cache is missing, stale or unavailable
+    """
+    if feather is None or not os.path.exists(PRODUCTS_CACHE_FILEPATH):
+        return None
+    try:
+        # Feather is the Arrow IPC file format: memory-map it and check the signature in
+        # the schema before touching any column data
+        with pa.memory_map(PRODUCTS_CACHE_FILEPATH) as source:
+            reader = pa.ipc.open_file(source)
+            metadata = reader.schema.metadata or {}
+            if metadata.get(_CACHE_SIGNATURE_KEY) != repr((_CACHE_FORMAT_VERSION, signature)).encode():
+                return None
+            return reader.read_all().to_pandas()
+    except Exception as e:
+        print(f"Could not read products cache {PRODUCTS_CACHE_FILEPATH}: {str(e)}")
+        return None
+
+def _write_products_cache(df: pd.DataFrame, signature: tuple) -> None:
+    """
+    Save the cleaned products as feather so later cold starts can skip CSV parsing
+    
+    Args:
+        df: Cleaned products DataFrame
+        signature: (mtime_ns, size) of the CSV file it was parsed from
+    """
+    if pa is None:
+        return
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        table = table.replace_schema_metadata({
+            **(table.schema.metadata or {}),
+            _CACHE_SIGNATURE_KEY: repr((_CACHE_FORMAT_VERSION, signature)).encode()
+        })
+        # Write to a temporary file first so readers never see a partial cache
+        # (one per process, so processes sharing the data directory do not collide)
+        temp_path = f"{PRODUCTS_CACHE_FILEPATH}.{os.getpid()}.tmp"
+        # Uncompressed so reads decode straight from the memory-mapped file
+        feather.write_feather(table, temp_path, compression="uncompressed")
+        os.replace(temp_path, PRODUCTS_CACHE_FILEPATH)
+    except Exception as e:
+        print(f"Could not write products cache {PRODUCTS_CACHE_FILEPATH}: {str(e)}")
+
+def _build_catalog(df: pd.DataFrame, signature: tuple, version: int) -> _Catalog:
+    """
+    Build a catalog snapshot from a normalized products DataFrame
+    
+    Args:
+        df: Normalized products DataFrame
+        signature: (mtime_ns, size) of the CSV file it came from
+        version: Version number of the snapshot
+        
+    Returns:
+        _Catalog: The products and every lookup derived from them
+    """
+    token_index = _build_token_index(df)
+    
+    # First occurrence wins for duplicate ids; missing values are found in one vectorized pass
+    unique_df = df[~df['id'].duplicated(keep='first')]
+    present = unique_df.notna().to_numpy()
+    products_by_id = {
+        record['id']: {column: value for (column, value), is_present in zip(record.items(), row_present) if is_present}
+        for record, row_present in zip(unique_df.to_dict(orient='records'), present)
+    }
+    
+    # Case-insensitive category/brand filters become a comparison of integer codes
+    filter_arrays = {}
+    label_codes = {}
+    for column in ('category', 'brand'):
+        if column in df.columns:
+            lowered = df[column].str.lower().astype('category')
+            filter_arrays[column] = lowered.cat.codes.to_numpy()
+            label_codes[column] = {label: code for code, label in enumerate(lowered.cat.categories)}
+    if 'rating' in df.columns:
+        filter_arrays['rating'] = df['rating'].to_numpy(dtype=np.float64, na_value=np.nan)
+    if 'in_stock' in df.columns:
+        filter_arrays['in_stock'] = df['in_stock'].to_numpy(dtype=bool)
+    
+    prices = df['price'].to_numpy()
+    price_order = np.argsort(prices, kind='stable')
+    
+    return _Catalog(
+        version=version,
+        signature=signature,
+        df=df,
+        category_counts=df['category'].value_counts().sort_index().to_dict(),
+        categories=df['category'].unique().tolist(),
+        token_index=token_index,
+        token_postings=lru_cache(maxsize=_TOKEN_POSTINGS_CACHE_SIZE)(partial(_token_postings, token_index)),
+        products_by_id=products_by_id,
+        product_columns=list(unique_df.columns),
+        filter_arrays=filter_arrays,
+        label_codes=label_codes,
+        text_lower={column: df[column].str.lower() for column in ('name', 'description') if column in df.columns},
+        price_order=price_order,
+        sorted_prices=prices[price_order]
+    )
+
+def _read_products_csv() -> pd.DataFrame:
+    """
+    Parse the products CSV with the fast C engine, retrying with the more forgiving
+    python engine if the C parser rejects the file
+    
+    Returns:
+        pd.DataFrame: Raw product rows
+    """
+    read_options = dict(
+        quotechar='"', 
+        quoting=csv.QUOTE_MINIMAL,
+        on_bad_lines='warn' # Keep warning to see if lines are still skipped
+    )
+    # Arrow-backed columns hold strings without per-value Python objects and
+    # filter with Arrow's compute kernels
+    if pa is not None:
+        read_options['dtype_backend'] = 'pyarrow'
+
+    try:
+        return pd.read_csv(CSV_FILEPATH, **read_options)
+    except pd.errors.ParserError as e:
+        print(f"C parser failed on {CSV_FILEPATH} ({str(e)}), retrying with the python engine")
+        return pd.read_csv(CSV_FILEPATH, engine='python', **read_options)
+
+def _csv_signature() -> tuple:
+    """(mtime_ns, size) of the products CSV, which changes whenever the file is rewritten"""
+    file_stat = os.stat(CSV_FILEPATH)
+    return (file_stat.st_mtime_ns, file_stat.st_size)
+
+def _load_catalog() -> Optional[_Catalog]:
+    """
+    Get the catalog snapshot for the current products CSV, loading it if the file changed
+    
+    The snapshot is kept in memory and shared between callers; the CSV is only parsed
+    again when it changes on disk, by one thread at a time. With pyarrow installed,
+    the cleaned data is also cached as feather next to the CSV so a fresh process can
+    skip parsing.
     
     Returns:
-        pd.DataFrame: DataFrame containing product data
+        Optional[_Catalog]: The current snapshot, or None if the products could not be loaded
     """
+    global _catalog, PRODUCTS_VERSION
     try:
         # Check if CSV file exists
         if not os.path.exists(CSV_FILEPATH):
             raise FileNotFoundError(f"Products CSV file not found at {CSV_FILEPATH}")
         
-        # Load the data with explicit quoting rules and python engine
-        df = pd.read_csv(
-            CSV_FILEPATH, 
-            engine='python', # Use the python engine for more robust parsing
-            quotechar='"', 
-            quoting=csv.QUOTE_MINIMAL,
-            on_bad_lines='warn' # Keep warning to see if lines are still skipped
-        )
-        
-        # Ensure required columns exist (using the actual header names)
-        required_columns = ['product_id', 'name', 'price', 'category'] 
-        missing_columns = [col for col in required_columns if col not in df.columns]
-        
-        if missing_columns:
-            raise ValueError(f"Missing required columns in CSV: {', '.join(missing_columns)}")
+        # Reuse the in-memory snapshot while the file is unchanged
+        catalog = _catalog
+        if catalog is not None and catalog.signature == _csv_signature():
+            return catalog
         
-        # Rename product_id to id for consistency if needed elsewhere
-        if 'product_id' in df.columns:
-            df.rename(columns={'product_id': 'id'}, inplace=True)
+        with _load_lock:
+            # Another thread may have loaded the changed file while this one waited
+            signature = _csv_signature()
+            catalog = _catalog
+            if catalog is not None and catalog.signature == signature:
+                return catalog
             
-        # Attempt to convert types, handling potential errors
-        if 'price' in df.columns:
-            df['price'] = pd.to_numeric(df['price'], errors='coerce')
-        if 'rating' in df.columns:
-            df['rating'] = pd.to_numeric(df['rating'], errors='coerce')
-        if 'in_stock' in df.columns:
-             # Convert various string representations of boolean to actual boolean
-            if pd.api.types.is_string_dtype(df['in_stock']):
-                df['in_stock'] = df['in_stock'].str.lower().map({'true': True, 'yes': True}).fillna(False).astype(bool)
-            else:
-                df['in_stock'] = df['in_stock'].astype(bool)
-        
-        # Drop rows where essential numeric columns couldn't be parsed
-        df.dropna(subset=['id', 'price'], inplace=True)
+            # A feather cache built from this exact CSV skips parsing entirely
+            df = _read_products_cache(signature)
+            if df is None:
+                df = _read_products_csv()
+            
+                # Ensure required columns exist (using the actual header names)
+                required_columns = ['product_id', 'name', 'price', 'category'] 
+                missing_columns = [col for col in required_columns if col not in df.columns]
+            
+                if missing_columns:
+                    raise ValueError(f"Missing required columns in CSV: {', '.join(missing_columns)}")
+            
+                # Rename product_id to id for consistency if needed elsewhere
+                if 'product_id' in df.columns:
+                    df.rename(columns={'product_id': 'id'}, inplace=True)
+                
+                # Attempt to convert types, handling potential errors
+                if 'price' in df.columns:
+                    df['price'] = pd.to_numeric(df['price'], errors='coerce')
+                if 'rating' in df.columns:
+                    df['rating'] = pd.to_numeric(df['rating'], errors='coerce')
+                if 'in_stock' in df.columns:
+                    # Coerce every representation (bools, 1/0, "true"/"yes", blanks) to a plain
+                    # bool column once, so lookups and filters can use the values directly
+                    df['in_stock'] = df['in_stock'].astype(str).str.strip().str.lower().isin(_IN_STOCK_TRUE_VALUES)
             
-        return df
+                # Drop rows where essential numeric columns couldn't be parsed
+                df.dropna(subset=['id', 'price'], inplace=True)
+                
+                _write_products_cache(df, signature)
+            
+            catalog = _build_catalog(_normalize_products(df), signature, PRODUCTS_VERSION + 1)
+            
+            # Publish the complete snapshot in one assignment, then bump the data version
+            _catalog = catalog
+            PRODUCTS_VERSION = catalog.version
+            
+        return catalog
     
     except pd.errors.ParserError as pe:
         print(f"Pandas ParserError loading products data: {str(pe)}")
@@ -91,15 +480,32 @@ def load_products_data() -> pd.DataFrame:
                     print("Could not extract line number from parser error.")
         except Exception as read_err:
             print(f"Could not read problematic line: {read_err}")
-        # Return empty DataFrame in case of parsing error to avoid crashing downstream
-        return pd.DataFrame(columns=['id', 'name', 'price', 'category', 'description', 'brand', 'rating'])
+        # No catalog in case of parsing error, so callers fall back instead of crashing downstream
+        return None
         
     except Exception as e:
         print(f"General Error loading products data: {str(e)}")
-        # Return empty DataFrame if there's any other error
-        return pd.DataFrame(columns=['id', 'name', 'price', 'category', 'description', 'brand', 'rating'])
+        # No catalog if there's any other error
+        return None
+
+def load_products_data() -> pd.DataFrame:
+    """
+    Load product data from CSV file
+    
+    The parsed and normalized DataFrame is kept in memory and shared between
+    callers; the CSV is only parsed again when it changes on disk. With pyarrow
+    installed, the cleaned data is also cached as feather next to the CSV so a
+    fresh process can skip parsing.
+    
+    Returns:
+        pd.DataFrame: DataFrame containing product data (empty if it could not be loaded)
+    """
+    catalog = _load_catalog()
+    if catalog is None:
+        return pd.DataFrame(columns=_EMPTY_PRODUCTS_COLUMNS)
+    return catalog.df
 
-def search_products(query: str, min_price: Optional[float] = None, max_price: Optional[float] = None, category: Optional[str] = None, brand: Optional[str] = None, rating_min: Optional[float] = None, in_stock_only: bool = True, sort_by: str = "price_low") -> pd.DataFrame:
+def search_products(query: str, min_price: Optional[float] = None, max_price: Optional[float] = None, category: Optional[str] = None, brand: Optional[str] = None, rating_min: Optional[float] = None, in_stock_only: bool = True, sort_by: str = "price_low", top_k: Optional[int] = None) -> pd.DataFrame:
     """
     Search for products based on query, price range, category, brand, rating, stock, and sort order.
     
@@ -112,66 +518,80 @@ def search_products(query: str, min_price: Optional[float] = None, max_price: Op
         rating_min: Minimum rating filter (optional)
         in_stock_only: If True, filter for in-stock items (default: True)
         sort_by: Sorting criteria ("price_low", "price_high", "rating", "newest")
+        top_k: Only return the first top_k products of the sort order (optional)
     
     Returns:
         DataFrame containing matching products
     """
     try:
-        # Load products data
-        df = load_products_data()
+        # Load products data; the whole search reads this one snapshot
+        catalog = _load_catalog()
         
-        # Apply filters
-        filtered_df = df.copy()
+        # Loading failed; there is nothing to search
+        if catalog is None:
+            return pd.DataFrame(columns=_EMPTY_PRODUCTS_COLUMNS)
+        df = catalog.df
+        filter_arrays = catalog.filter_arrays
+        
+        # Candidate row positions, narrowed with the in-memory indexes first
+        rows = np.arange(len(df))
+        
+        # Price range via binary search on the presorted prices
+        if min_price is not None or max_price is not None:
+            rows = _price_range_positions(catalog, min_price, max_price)
+        
+        # Text queries via the token index
+        if query and not query.isspace() and not _REGEX_METACHARACTERS.search(query):
+            text_positions = text_search(query, catalog)
+            if text_positions is not None:
+                rows = np.intersect1d(rows, text_positions)
+        
+        # Evaluate the remaining filters as one fused mask over the candidates'
+        # column arrays, then build the filtered DataFrame once
+        keep = np.ones(len(rows), dtype=bool)
         
         # Apply category filter if provided
         if category is not None:
-            filtered_df = filtered_df[filtered_df['category'].str.lower() == category.lower()]
+            keep &= filter_arrays['category'][rows] == catalog.label_codes['category'].get(category.lower(), _NO_CODE)
             
         # Apply brand filter if provided
-        if brand is not None and 'brand' in filtered_df.columns:
-            filtered_df = filtered_df[filtered_df['brand'].str.lower() == brand.lower()]
-        
-        # Apply price range filters if provided
-        if min_price is not None:
-            filtered_df = filtered_df[filtered_df['price'] >= min_price]
-        
-        if max_price is not None:
-            filtered_df = filtered_df[filtered_df['price'] <= max_price]
+        if brand is not None and 'brand' in filter_arrays:
+            keep &= filter_arrays['brand'][rows] == catalog.label_codes['brand'].get(brand.lower(), _NO_CODE)
             
         # Apply minimum rating filter if provided
-        if rating_min is not None and 'rating' in filtered_df.columns:
-             # Ensure rating column is numeric, coerce errors to NaN
-            filtered_df['rating'] = pd.to_numeric(filtered_df['rating'], errors='coerce')
-            filtered_df = filtered_df[filtered_df['rating'] >= rating_min]
+        if rating_min is not None and 'rating' in filter_arrays:
+            keep &= filter_arrays['rating'][rows] >= rating_min
             
         # Apply in-stock filter if requested
-        if in_stock_only and 'in_stock' in filtered_df.columns:
-            # Handle boolean or string representations of stock status
-            if pd.api.types.is_string_dtype(filtered_df['in_stock']):
-                filtered_df = filtered_df[filtered_df['in_stock'].str.lower() == 'true']
-            else:
-                 # Assume boolean if not string
-                filtered_df = filtered_df[filtered_df['in_stock'] == True]
+        if in_stock_only and 'in_stock' in filter_arrays:
+            keep &= filter_arrays['in_stock'][rows]
+        
+        positions = rows[keep]
         
         # If query is provided, filter based on query matching name or description
+        # (this confirms the exact substring match on the candidates found above)
         if query and not query.isspace():
             # Convert query to lowercase for case-insensitive matching
             query_lower = query.lower()
             
-            # Create mask for products where name or description contains the query
-            name_mask = filtered_df['name'].str.lower().str.contains(query_lower, na=False)
+            # Create mask for products where name or description contains the query,
+            # using the columns lower-cased at load time
+            mask = _contains(catalog.text_lower['name'].iloc[positions], query_lower).to_numpy(dtype=bool)
             
             # Check if description column exists before filtering on it
-            desc_mask = pd.Series([False] * len(filtered_df))
-            if 'description' in filtered_df.columns:
-                desc_mask = filtered_df['description'].str.lower().str.contains(query_lower, na=False)
+            if 'description' in catalog.text_lower:
+                mask = mask | _contains(catalog.text_lower['description'].iloc[positions], query_lower).to_numpy(dtype=bool)
                 
-            mask = name_mask | desc_mask
-            filtered_df = filtered_df[mask]
+            positions = positions[mask]
+        
+        # Every filter has narrowed the positions, so the rows are copied out only once
+        filtered_df = df.iloc[positions]
             
-        # Apply sorting
+        # Apply sorting (a partial selection is enough when only the top rows are needed)
         if not filtered_df.empty:
-            if sort_by == "price_low":
+            if top_k is not None:
+                filtered_df = _top_k_rows(filtered_df, sort_by, top_k)
+            elif sort_by == "price_low":
                 filtered_df = filtered_df.sort_values(by='price', ascending=True)
             elif sort_by == "price_high":
                 filtered_df = filtered_df.sort_values(by='price', ascending=False)
@@ -185,32 +605,33 @@ def search_products(query: str, min_price: Optional[float] = None, max_price: Op
     
     except Exception as e:
         print(f"Error searching products: {str(e)}")
-        return pd.DataFrame(columns=['id', 'name', 'price', 'category', 'description', 'brand', 'rating'])
+        return pd.DataFrame(columns=_EMPTY_PRODUCTS_COLUMNS)
 
-def get_product_by_id(product_id: int) -> Optional[Dict[str, Any]]:
+def get_product_by_id(product_id: int, drop_missing: bool = False) -> Optional[Dict[str, Any]]:
     """
     Retrieve a product by its ID
     
     Args:
         product_id: ID of the product to retrieve
+        drop_missing: If True, leave out fields with missing values (default: False)
     
     Returns:
         Dictionary containing product data, or None if not found
     """
     try:
-        # Load products data
-        df = load_products_data()
-        
-        # Find product with matching ID
-        product = df[df['id'] == product_id]
-        
-        if product.empty:
+        # Load products data (refreshes the id map if the CSV changed)
+        catalog = _load_catalog()
+        if catalog is None:
             return None
         
-        # Convert product to dictionary
-        product_dict = product.iloc[0].to_dict()
+        product = catalog.products_by_id.get(int(product_id))
+        if product is None:
+            return None
         
-        return product_dict
+        # Hand out a copy so callers cannot modify the shared map
+        if drop_missing:
+            return dict(product)
+        return {column: product.get(column, np.nan) for column in catalog.product_columns}
     
     except Exception as e:
         print(f"Error retrieving product: {str(e)}")
@@ -225,12 +646,12 @@ def get_product_categories() -> List[str]:
     """
     try:
         # Load products data
-        df = load_products_data()
-        
-        # Get unique categories
-        categories = df['category'].unique().tolist()
+        catalog = _load_catalog()
+        if catalog is None or catalog.df.empty:
+            return []
         
-        return categories
+        # Unique categories are computed once per catalog load
+        return list(catalog.categories)
     
     except Exception as e:
         print(f"Error retrieving categories: {str(e)}")
@@ -241,21 +662,48 @@ def get_category_count() -> Dict[str, int]:
     Get a count of products in each category
     
     Returns:
-        Dictionary mapping category names to product counts
+        Dictionary mapping category names to product counts, sorted by category name
     """
     try:
         # Load products data
-        df = load_products_data()
+        catalog = _load_catalog()
+        if catalog is None or catalog.df.empty:
+            return {}
         
-        # Count products in each category
-        category_counts = df['category'].value_counts().to_dict()
-        
-        return category_counts
+        # Counts are computed once per catalog load
+        return dict(catalog.category_counts)
     
     except Exception as e:
         print(f"Error counting categories: {str(e)}")
         return {}
 
+# Markdown Helper Functions
+
+def markdown_text(text: str) -> str:
+    """
+    Escape dollar signs so Markdown renderers (st.markdown) show prices instead of
+    reading a pair of them as LaTeX
+    
+    Args:
+        text (str): Plain text
+        
+    Returns:
+        str: The text, safe to render as Markdown
+    """
+    return text.replace("$", "\\$")
+
+def markdown_list(items: List[str]) -> str:
+    """
+    Render plain-text items as a Markdown bullet list, one item per line
+    
+    Args:
+        items (List[str]): Plain-text items
+        
+    Returns:
+        str: A "- " bullet per item, with dollar signs escaped
+    """
+    return "\n".join(f"- {markdown_text(item)}" for item in items)
+
 # STT/TTS Helper Functions (Placeholders)
 
 def transcribe_audio(audio_data: bytes) -> str: